@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Checks of the query engine and environment machinery shared by all domains,
+run on the 3Build domain.
+
+@author: Anonymous
+"""
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import scripts.GMEnv as sim
+import scripts.Tester as test
+import scripts.Solver as solver
+from scripts.MDPExport import MDPExporter
+import hashlib
+import subprocess
+import tempfile
+import unittest
+
+
+class TestEngine(unittest.TestCase):
+
+    domain = "./examples/discrete/3Build.pl"
+    dtGologOptimal = 0.47599999999999987
+
+    def setUp(self):
+        self.env = self.makeEnv()
+        self.t = test.TestIt(self.env)
+        self.t.debug = False
+
+    def tearDown(self):
+        self.env.closeQE()
+
+    def makeEnv(self, domain = None, **options):
+        # An environment set up as the tests of a domain set theirs up.
+        env = sim.GMEnv(domain or self.domain, **options)
+        env.setDebug(False)
+        env.setSeed(123)
+        return env
+
+    def test_twoEngines(self):
+        # Engines built one after the other in one process load the domain,
+        # the interface and DT-Golog into modules of their own, and step alike.
+        other = self.makeEnv()
+        order = self.makeEnv("./examples/discrete/1Order.pl")
+        self.env.reset()
+        other.reset()
+        for i, action in enumerate([0, 1, 2, 3]):
+            stateObs, rewardObs, doneObs, _, info = self.env.step(action)
+            stateO, rewardO, doneO, _, infoO = other.step(action)
+            self.assertEqual(stateObs, stateO, msg = "\n (Step: {}) - Wrong state".format(i))
+            self.assertAlmostEqual(rewardObs, rewardO, places = 6, msg = "\n (Step: {}) - Wrong reward".format(i))
+            self.assertEqual(doneObs, doneO, msg = "\n (Step: {}) - Wrong 'done' status".format(i))
+            self.assertEqual(info["eH"], infoO["eH"], msg = "\n (Step: {}) - Wrong eH".format(i))
+        order.reset()
+        _, _, _, _, info = order.step(0)
+        self.assertNotEqual(info["stAction"], -1)
+        other.closeQE()
+        order.closeQE()
+
+    def test_engineReuse(self):
+        # A new engine takes over the module of a closed one of the same domain,
+        # as it was loaded, instead of loading yet another copy.
+        first = self.makeEnv()
+        module = first.qmi.module
+        first.reset()
+        expected = [first.step(action)[:3] for action in [0, 2]]
+        first.closeQE()
+        second = self.makeEnv()
+        self.assertEqual(second.qmi.module, module)
+        second.reset()
+        self.assertEqual([second.step(action)[:3] for action in [0, 2]], expected)
+        second.closeQE()
+
+    def loadInProcess(self, domain):
+        # What an engine caching compiled files answers, built in a process of
+        # its own so that it is the first of the process to load the domain.
+        script = ("import sys\n"
+                  "import scripts.QE.QueryEngine as qe\n"
+                  "engine = qe.QueryEngine(sys.argv[1], qlfCache = True)\n"
+                  "print(repr((engine.getDomainParams(), engine.getInfeasiblePenalty(), engine.getOutcomes(0, ''))))\n")
+        result = subprocess.run([sys.executable, "-c", script, domain], capture_output = True, text = True)
+        self.assertEqual(result.returncode, 0, msg = result.stderr)
+        return result.stdout.strip()
+
+    def sourceHash(self, path):
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def test_qlfCache(self):
+        # The first load compiles the domain and records the hash of its source;
+        # the next reads the compiled file as it is, and one after the source 
+        # has changed compiles it anew. All answer as the source does.
+        with open(self.domain) as f:
+            source = f.read()
+        # Next to the original, for its relative consults to hold.
+        fd, domain = tempfile.mkstemp(suffix = ".pl", dir = os.path.dirname(self.domain))
+        os.close(fd)
+        qlf, hashFile = os.path.splitext(domain)[0] + ".qlf", os.path.splitext(domain)[0] + ".qlf.sha256"
+        try:
+            with open(domain, "w") as f:
+                f.write(source)
+            qmi = self.env.qmi
+            expected = repr((qmi.getDomainParams(), qmi.getInfeasiblePenalty(), qmi.getOutcomes(0, '')))
+            self.assertEqual(self.loadInProcess(domain), expected)
+            self.assertTrue(os.path.exists(qlf))
+            with open(hashFile) as f:
+                self.assertEqual(f.read().strip(), self.sourceHash(domain))
+            compiled = os.stat(qlf).st_mtime_ns
+
+            self.assertEqual(self.loadInProcess(domain), expected)
+            self.assertEqual(os.stat(qlf).st_mtime_ns, compiled)
+
+            with open(domain, "a") as f:
+                f.write("\n% Changed.\n")
+            self.assertEqual(self.loadInProcess(domain), expected)
+            self.assertNotEqual(os.stat(qlf).st_mtime_ns, compiled)
+            with open(hashFile) as f:
+                self.assertEqual(f.read().strip(), self.sourceHash(domain))
+        finally:
+            for path in [domain, qlf, hashFile]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def test_masks(self):
+        # Until a masked episode is done, at least one action is valid, 
+        # including once every possible action of the run has been attempted.
+        self.env.setMasked(True)
+        for episode in range(50):
+            self.env.reset()
+            done = False
+            while not done:
+                mask = self.env.action_masks()
+                self.assertTrue(mask.any(), msg = "\n (Episode: {}) - No valid action: {}".format(episode, self.env.tH))
+                _, _, done, _, info = self.env.step(self.env.action_space.sample(mask = mask.astype("int8")))
+                self.assertNotEqual(info["stAction"], -1)
+            self.assertFalse(self.env.action_masks().any())
+
+    def test_unmaskedEpisodes(self):
+        # Unmasked, an episode ends as it always did: on an infeasible attempt,
+        # once all runs are concluded or once no action is possible at all. 
+        # The episodes of simulate() are those, step for step.
+        for seed in range(100):
+            score = self.t.runEpisode([], forgivePenalty = False, seed = seed)
+            self.env.reset(seed = seed)
+            done = False
+            total = 0
+            while not done:
+                _, reward, done, _, info = self.env.step(self.env.action_space.sample())
+                total += reward
+                ended = (info["stAction"] == -1 or info["Run"] == self.env.runsNum 
+                         or self.env.situationInfo()["Done"])
+                self.assertEqual(done, ended, msg = "\n (Seed: {}) - Wrong 'done' status: {}".format(seed, self.env.tH))
+            self.assertEqual(score, total, msg = "\n (Seed: {}) - Wrong score".format(seed))
+
+    def test_solver(self):
+        # Value iteration over the exported domain finds the optimum, which 
+        # ordering from supplier 1 and assigning subcontractor 1 attains exactly.
+        solution = solver.solveDomain(self.domain)
+        self.assertEqual(solution["policy"][0], 0)
+        self.assertAlmostEqual(solution["value"], self.t.evaluate_exact([0,2]), places = 6)
+        exporter = MDPExporter(self.domain)
+        mdp = exporter.explore()
+        exporter.close()
+        self.assertEqual(solver.valueIteration(mdp)["value"], solution["value"])
+        with self.assertRaises(ValueError):
+            solver.valueIteration(mdp, maxIter = 0)
+
+    def test_optimalExact(self):
+        # The exact expected reward of the crude policy is DT-Golog's optimum,
+        # and a long seeded simulation converges to it.
+        exact = self.t.evaluate_exact([0,2])
+        self.assertAlmostEqual(exact, self.dtGologOptimal, places = 6)
+        self.assertAlmostEqual(self.t.simulate(5000, [0,2], seed = 123), exact, places = 1)
+        with self.assertRaises(ValueError):
+            self.t.evaluate_exact([])
+
+    def test_infoLevels(self):
+        # Every info level reports the documented keys, and only those. Below
+        # debug, the masks are queried apart, and are the same.
+        minimal = {"stAction", "Run", "is_success"}
+        standard = minimal | {"bitState", "tH", "eH", "Achieved"}
+        masks = None
+        for level, keys in [("debug", standard | {"TransState", "action_mask"}), ("standard", standard), ("minimal", minimal)]:
+            env = self.makeEnv(infoLevel = level)
+            env.reset()
+            _, _, _, _, info = env.step(0)
+            self.assertEqual(set(info), keys, msg = "\n (Level: {}) - Wrong info keys".format(level))
+            if (masks is None):
+                masks = list(info["action_mask"])
+            self.assertEqual(list(env.action_masks()), masks, msg = "\n (Level: {}) - Wrong mask".format(level))
+            env.closeQE()
+
+    def test_progressionChecked(self):
+        # The instant reward of 3Build reads fluents that are not progressed: 
+        # the engine refuses progression rather than fail on every reward.
+        with self.assertRaisesRegex(ValueError, "orderSup1_InTime"):
+            self.makeEnv(progression = True)
+
+    def test_seededProlog(self):
+        # Rollouts within Prolog from the same seed return the same episodes.
+        first = self.t.simulate(200, inProlog = True, seed = 7)
+        firstRewards = self.t.episodes["reward"].copy()
+        second = self.t.simulate(200, inProlog = True, seed = 7)
+        self.assertEqual(first, second)
+        self.assertTrue((firstRewards == self.t.episodes["reward"]).all())
+        with self.assertRaises(ValueError):
+            self.t.simulate(10, inProlog = True, workers = 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
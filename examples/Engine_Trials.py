@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Trials of the environment machinery that start worker processes or learn,
+run on the 3Build domain.
+
+@author: Anonymous
+"""
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import scripts.GMEnv as sim
+import scripts.Tester as test
+from scripts.VecGMEnv import makeVecGMEnv
+from scripts.QE.RemoteQueryEngine import RemoteQueryEngine, QueryEnginePool
+import numpy as np
+from stable_baselines3 import PPO
+import unittest
+
+
+class TestEngine(unittest.TestCase):
+
+    domain = "./examples/discrete/3Build.pl"
+
+    def setUp(self):
+        self.env = sim.GMEnv(self.domain)
+        self.env.setDebug(False)
+        self.env.setSeed(123)
+        self.t = test.TestIt(self.env)
+        self.t.debug = False
+
+    def tearDown(self):
+        self.env.closeQE()
+
+    def test_sharedMemory(self):
+        # Workers exchanging their data through shared memory step like those
+        # of SubprocVecEnv, given the same seeds and actions, down to the bits
+        # and types of the rewards.
+        plain = makeVecGMEnv(self.domain, 2, seed = 123)
+        shared = makeVecGMEnv(self.domain, 2, seed = 123, sharedMemory = True)
+        np.testing.assert_array_equal(plain.reset(), shared.reset())
+        rng = np.random.default_rng(7)
+        for i in range(40):
+            actions = rng.integers(0, plain.action_space.n, 2)
+            obsP, rewardP, doneP, _ = plain.step(actions)
+            obsS, rewardS, doneS, _ = shared.step(actions)
+            np.testing.assert_array_equal(obsP, obsS, err_msg = "\n (Step: {}) - Wrong observations".format(i))
+            self.assertEqual(rewardP.dtype, rewardS.dtype, msg = "\n (Step: {}) - Wrong reward type".format(i))
+            np.testing.assert_array_equal(rewardP, rewardS, err_msg = "\n (Step: {}) - Wrong rewards".format(i))
+            np.testing.assert_array_equal(doneP, doneS, err_msg = "\n (Step: {}) - Wrong 'done' status".format(i))
+        plain.close()
+        shared.close()
+        self.assertTrue(shared.closed)
+
+    def test_remoteEngine(self):
+        # An environment on the query engine of a worker process steps like one
+        # on its own. Handles only travel as their ids, so the histories are 
+        # kept on both sides, including through a snapshot.
+        remote = RemoteQueryEngine(self.domain)
+        env = sim.GMEnv(self.domain, qmi = remote)
+        env.setDebug(False)
+        env.setSeed(123)
+        self.env.reset()
+        env.reset()
+        for i, action in enumerate([0, 2]):
+            expected = self.env.step(action)[:3]
+            self.assertEqual(env.step(action)[:3], expected, msg = "\n (Step: {}) - Different step".format(i))
+        self.assertEqual(env.sitHandle.history, self.env.sitHandle.history)
+        token = env.snapshot()
+        env.reset()
+        env.restore(token)
+        self.assertEqual(remote.getState(env.sitHandle), self.env.qmi.getState(self.env.sitHandle))
+        env.closeQE()
+        remote.close()
+
+    def test_enginePool(self):
+        # An engine given back to its pool after an episode that concluded a
+        # run is handed out again as it was loaded: the next environment starts
+        # from the domain's cross-run state, not from the one left behind.
+        domain = "./examples/discrete/6BuildMultiRun.pl"
+        pool = QueryEnginePool(domain, 1)
+        env = sim.GMEnv(domain, qmi = pool.acquire(), masked = True)
+        initial = env.initTransState
+        for seed in range(50):
+            env.reset(seed = seed)
+            done = False
+            while not (done or env.run > 0):
+                _, _, done, _, _ = env.step(env.action_space.sample(mask = env.action_masks().astype(np.int8)))
+            if (env.transState != initial):
+                break
+        self.assertNotEqual(env.transState, initial)
+        env.closeQE()
+        pool.release(env.qmi)
+        again = sim.GMEnv(domain, qmi = pool.acquire())
+        self.assertEqual(again.initTransState, initial)
+        again.closeQE()
+        pool.close()
+
+    def test_remoteLoadFailure(self):
+        # A worker that cannot load its domain reports why on the first call.
+        remote = RemoteQueryEngine("./examples/discrete/NoSuchDomain.pl")
+        with self.assertRaises(RuntimeError):
+            remote.getDomainParams()
+        remote.close()
+
+    def test_seededWorkers(self):
+        # Seeded simulations give the same episodes whatever the number of
+        # worker processes.
+        rewards = {}
+        for workers in [None, 1, 2]:
+            mean = self.t.simulate(300, seed = 123, workers = workers)
+            rewards[workers] = self.t.episodes["reward"].copy()
+            self.assertAlmostEqual(mean, rewards[workers].mean(), places = 6)
+        for workers in [1, 2]:
+            np.testing.assert_array_equal(rewards[None], rewards[workers],
+                                          err_msg = "\n (Workers: {}) - Different episodes".format(workers))
+
+    def test_batchedEvaluation(self):
+        # Testing a learned policy in batches, on environments built alongside 
+        # the tester's, gives the same average as one episode at a time.
+        model = PPO("MlpPolicy", self.env, verbose = 0, seed = 123)
+        model.learn(total_timesteps = 1000)
+        single = self.t.evaluatePolicy(model, 50, batch = 1, seed = 123)
+        batched = self.t.evaluatePolicy(model, 50, batch = 8, seed = 123)
+        self.assertAlmostEqual(single, batched, places = 6,
+                               msg = "\n Batched testing: {} one at a time, {} in batches".format(single, batched))
+
+
+if __name__ == '__main__':
+    unittest.main()
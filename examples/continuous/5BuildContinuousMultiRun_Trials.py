@@ -28,6 +28,7 @@ class TestSum(unittest.TestCase):
     
     learningOptimal = 0
     learningParams = 0
+    learningStats = 0
     dtGologOptimal = 0.928199999999999
     
     def setUp(self):
@@ -76,9 +77,10 @@ class TestSum(unittest.TestCase):
         None.
 
         """
-        result, params = self.t.test_learning(self.trainingIter,self.testingIter, logging = self.learningLoggingInterval, algo = self.learningAlgorithm)
+        result, params, stats = self.t.test_learning(self.trainingIter,self.testingIter, logging = self.learningLoggingInterval, algo = self.learningAlgorithm)
         TestSum.learningOptimal = result
         TestSum.learningParams = params
+        TestSum.learningStats = stats
         self.assertAlmostEqual(result,
                           self.dtGologOptimal, 
                           places = 0,
@@ -93,6 +95,7 @@ class TestSum(unittest.TestCase):
         print('Random policy reward.............. : {}'.format(cls.simRandom))
         print('Learned policy reward..............: {}'.format(cls.learningOptimal))
         print('--> Learning Parameters: \n {}'.format(cls.learningParams))
+        print('--> Learning Throughput: \n {}'.format(cls.learningStats))
 
 
 
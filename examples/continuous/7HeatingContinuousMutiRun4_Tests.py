@@ -247,6 +247,84 @@ class TestSum(unittest.TestCase):
         i+=1
         
 
+    def test_progressionAlone(self):
+        # A progressing environment on its own reproduces the expected steps of
+        # test_various, also after a reset drops the progressed situations.
+        envP = sim.GMEnv("./examples/continuous/7HeatingContinuousMultiRun4.pl", progression = True)
+        episodes = [[(0, 0, [26, 10], -1.92, False, "[roomTemp_Inst_fl(26.0), hvac_on_fl]"),
+                     (0, 1, [26.95, 10], -2.585, False, "[roomTemp_Inst_fl(26.95), hvac_on_fl]"),
+                     (1, 3, [27.8525, 10], -3.217, False, "[roomTemp_Inst_fl(27.8525), hvac_on_fl]"),
+                     (1, 2, [25.567249999999998, 0], -1.797075, True, "[roomTemp_Inst_fl(25.567249999999998)]")],
+                    [(0, 0, [26, 10], -1.92, False, "[roomTemp_Inst_fl(26.0), hvac_on_fl]"),
+                     (1, 2, [23.9, 0], -0.63, False, "[roomTemp_Inst_fl(23.9)]")]]
+        for episode in episodes:
+            envP.reset()
+            for i, (action, choice, stateExp, rewardExp, doneExp, transState) in enumerate(episode):
+                stateP, rewardP, doneP, _, infoP = envP.step(action, choice)
+                for obs, obsExp in zip(stateP, stateExp):
+                    self.assertAlmostEqual(obs, obsExp, places = 4, msg = "\n (Step: {}) - Wrong state".format(i))
+                self.assertAlmostEqual(rewardP, rewardExp, places = 4, msg = "\n (Step: {}) - Wrong reward".format(i))
+                self.assertEqual(doneP, doneExp, msg = "\n (Step: {}) - Wrong 'done' status".format(i))
+                self.assertEqual(infoP["TransState"], transState, msg = "\n (Step: {}) - Wrong 'TransState' status".format(i))
+        envP.closeQE()
+
+    def test_progression(self):
+        # An environment progressing the state must see exactly what the 
+        # regressing one sees. Both environments share one Prolog process.
+        envP = sim.GMEnv("./examples/continuous/7HeatingContinuousMultiRun4.pl", progression = True)
+        self.env.reset()
+        envP.reset()
+        for i, (action, choice) in enumerate([(0,0),(0,1),(1,2),(1,3),(0,0)]):
+            stateObs, rewardObs, doneObs, _, info = self.env.step(action, choice)
+            stateP, rewardP, doneP, _, infoP = envP.step(action, choice)
+            for obs, obsP in zip(stateObs, stateP):
+                self.assertAlmostEqual(obs, obsP, places = 6, msg = "\n (Step: {}) - Wrong state".format(i))
+            self.assertAlmostEqual(rewardObs, rewardP, places = 6, msg = "\n (Step: {}) - Wrong reward".format(i))
+            self.assertEqual(doneObs, doneP, msg = "\n (Step: {}) - Wrong 'done' status".format(i))
+            self.assertEqual(info["Achieved"], infoP["Achieved"], msg = "\n (Step: {}) - Wrong 'achieved' status".format(i))
+            self.assertEqual(info["TransState"], infoP["TransState"], msg = "\n (Step: {}) - Wrong 'TransState' status".format(i))
+        envP.closeQE()
+
+    def test_progressionCache(self):
+        # Cached query results of a progressing engine must be what the engine
+        # answers: misses query the handle progressed through the effects it
+        # lacks, or progressed anew after a reset or a restore.
+        envPC = sim.GMEnv("./examples/continuous/7HeatingContinuousMultiRun4.pl", progression = True, cacheSize = 1000)
+        for episode in [[(0,0),(0,1),(1,2),(1,3)], [(1,3),(0,0),(1,2),(0,1)], [(0,0),(0,1),(1,2),(1,3)]]:
+            self.env.reset()
+            envPC.reset()
+            for i, (action, choice) in enumerate(episode):
+                if (i == 2):
+                    # A step undone, along with the run it concluded and its cross-run state.
+                    token, tokenPC = self.env.snapshot(), envPC.snapshot()
+                    self.env.step(action, choice)
+                    envPC.step(action, choice)
+                    self.env.restore(token)
+                    envPC.restore(tokenPC)
+                _, rewardObs, doneObs, _, _ = self.env.step(action, choice)
+                _, rewardPC, donePC, _, _ = envPC.step(action, choice)
+                self.assertAlmostEqual(rewardObs, rewardPC, places = 6, msg = "\n (Step: {}) - Wrong reward".format(i))
+                self.assertEqual(doneObs, donePC, msg = "\n (Step: {}) - Wrong 'done' status".format(i))
+                self.assertEqual(self.env.situationInfo(), envPC.situationInfo(), msg = "\n (Step: {}) - Wrong step info".format(i))
+        self.assertGreater(envPC.qmi.hits, 0)
+        envPC.closeQE()
+
+    def test_tabling(self):
+        # A tabled engine must answer what an untabled one does, also after the
+        # resets that set the cross-run state anew and abolish the tables.
+        envT = sim.GMEnv("./examples/continuous/7HeatingContinuousMultiRun4.pl", tabling = True)
+        for episode in [[(0,0),(0,1),(1,2),(1,3)], [(1,3),(0,0),(1,2),(0,1)], [(0,0),(0,1),(1,2),(1,3)]]:
+            self.env.reset()
+            envT.reset()
+            self.assertEqual(self.env.situationInfo(), envT.situationInfo())
+            for i, (action, choice) in enumerate(episode):
+                _, rewardObs, doneObs, _, _ = self.env.step(action, choice)
+                _, rewardT, doneT, _, _ = envT.step(action, choice)
+                self.assertAlmostEqual(rewardObs, rewardT, places = 6, msg = "\n (Step: {}) - Wrong reward".format(i))
+                self.assertEqual(doneObs, doneT, msg = "\n (Step: {}) - Wrong 'done' status".format(i))
+                self.assertEqual(self.env.situationInfo(), envT.situationInfo(), msg = "\n (Step: {}) - Wrong step info".format(i))
+        envT.closeQE()
+
 
 if __name__ == '__main__':
     unittest.main()
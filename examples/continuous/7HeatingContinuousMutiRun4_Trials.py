@@ -27,6 +27,7 @@ class TestSum(unittest.TestCase):
     
     learningOptimal = 0
     learningParams = 0
+    learningStats = 0
     #dtGologOptimal = -1.20853
     dtGologOptimal = -1.360857084
     
@@ -75,9 +76,10 @@ class TestSum(unittest.TestCase):
         None.
 
         """
-        result, params = self.t.test_learning(self.trainingIter,self.testingIter, logging = self.learningLoggingInterval, algo = self.learningAlgorithm)
+        result, params, stats = self.t.test_learning(self.trainingIter,self.testingIter, logging = self.learningLoggingInterval, algo = self.learningAlgorithm)
         TestSum.learningOptimal = result
         TestSum.learningParams = params
+        TestSum.learningStats = stats
         self.assertAlmostEqual(result,
                           self.dtGologOptimal, 
                           places = 0,
@@ -92,6 +94,7 @@ class TestSum(unittest.TestCase):
         print('Random policy reward.............. : {}'.format(cls.simRandom))
         print('Learned policy reward..............: {}'.format(cls.learningOptimal))
         print('--> Learning Parameters: \n {}'.format(cls.learningParams))
+        print('--> Learning Throughput: \n {}'.format(cls.learningStats))
 
 
 
@@ -8,6 +8,12 @@ Created on Mon Sep 19 11:22:43 2022
 
 import scripts.GMEnv as sim
 import scripts.Tester as test
+import scripts.MDPExport as mdpx
+import scripts.GMTableEnv as tab
+import numpy as np
+import copy
+import os
+import tempfile
 import unittest
 
 
@@ -504,6 +510,89 @@ class TestSum(unittest.TestCase):
                       transState= "[]",
                       ID = i,choice = 0)
 
+    def test_snapshot(self):
+        self.env.step(1, 4)
+        token = self.env.snapshot()
+        first = copy.deepcopy(self.env.step(0, 0))
+        self.t.reset()
+        self.env.step(0, 0)
+        self.env.restore(token)
+        again = copy.deepcopy(self.env.step(0, 0))
+        self.assertEqual(first[:4], again[:4])
+        for k in ["stAction", "bitState", "tH", "eH", "Run", "Achieved", "TransState"]:
+            self.assertEqual(first[4][k], again[4][k], msg = "Info {} differs".format(k))
+
+    def test_observation_modes(self):
+        bits = len(self.env.initBitState[0])
+        envs = {mode: sim.GMEnv("./examples/discrete/2OrderMultiRun.pl", obsMode = mode)
+                for mode in ["multibinary", "compact"]}
+        obs = {mode: e.reset()[0] for mode, e in envs.items()}
+        for action, choice in [(1,4),(0,0),(1,1)]:
+            state, _, _, _, info = self.env.step(action, choice)
+            for mode, e in envs.items():
+                obs[mode] = e.step(action, choice)[0]
+                self.assertTrue(e.observation_space.contains(obs[mode]))
+            flat = [int(b) for b in format(state, "0{}b".format(bits*self.env.runsNum))]
+            self.assertEqual(flat, list(obs["multibinary"]))
+            current = info["bitState"][min(info["Run"], self.env.runsNum - 1)]
+            self.assertEqual(current + [info["Run"]], list(obs["compact"]))
+        for e in envs.values():
+            e.closeQE()
+
+    def test_mdp_export(self):
+        exporter = mdpx.MDPExporter("./examples/discrete/2OrderMultiRun.pl")
+        with tempfile.TemporaryDirectory() as d:
+            exporter.export(os.path.join(d, "mdp.npz"))
+            mdp = mdpx.loadMDP(os.path.join(d, "mdp.npz"))
+        exporter.close()
+        # Outcome probabilities of every feasible action add up to one.
+        sums = np.zeros(mdp["R"].shape)
+        np.add.at(sums, (mdp["P_s"], mdp["P_a"]), mdp["P_prob"])
+        np.testing.assert_allclose(sums[mdp["feasible"]], 1.0)
+        self.assertTrue(np.all(mdp["R"][~mdp["feasible"]] == self.env.inFeasiblePenalty))
+        # Following a path through the arrays agrees with the environment.
+        s = 0
+        for action, choice in [(1,4),(0,0)]:
+            _, reward, _, _, info = self.env.step(action, choice)
+            k = np.flatnonzero((mdp["P_s"] == s) & (mdp["P_a"] == action) & (mdp["P_stoch"] == choice))[0]
+            self.assertAlmostEqual(reward, mdp["P_reward"][k])
+            s = mdp["P_next"][k]
+            self.assertEqual(sum(info["bitState"], []), list(mdp["bits"][s]))
+            self.assertEqual(info["Run"], mdp["run"][s])
+        self.assertTrue(mdp["done"][s])
+
+    def test_table_backend(self):
+        tEnv = tab.GMTableEnv("./examples/discrete/2OrderMultiRun.pl")
+        actions = [1,0,2,1,0,0,1,2]
+        for seed in [15, 123, 321]:
+            trace = {}
+            for e in [self.env, tEnv]:
+                e.reset()
+                e.setSeed(seed)
+                # Copies, as GMEnv's info refers to lists it goes on changing.
+                trace[e] = [copy.deepcopy(e.step(a)) for a in actions]
+            for (sO, rO, dO, _, iO), (sT, rT, dT, _, iT) in zip(trace[self.env], trace[tEnv]):
+                self.assertEqual(sO, sT)
+                self.assertAlmostEqual(rO, rT)
+                self.assertEqual(dO, dT)
+                for k in ["stAction", "bitState", "tH", "eH", "Run", "Achieved", "TransState", "is_success"]:
+                    self.assertEqual(iO[k], iT[k], msg = "Info {} differs".format(k))
+                self.assertEqual(list(iO["action_mask"]), list(iT["action_mask"]))
+
+    def test_table_info(self):
+        # The table backend reports the info keys of GMEnv at every level, and
+        # names what is wrong with an outcome the action does not have.
+        for level in ["minimal", "standard", "debug"]:
+            env = sim.GMEnv("./examples/discrete/2OrderMultiRun.pl", infoLevel = level)
+            tEnv = tab.GMTableEnv("./examples/discrete/2OrderMultiRun.pl", infoLevel = level)
+            env.reset()
+            tEnv.reset()
+            self.assertEqual(set(env.step(0)[4]), set(tEnv.step(0)[4]), msg = "\n (Level: {}) - Info keys differ".format(level))
+            env.closeQE()
+        tEnv.reset()
+        with self.assertRaisesRegex(ValueError, "state 0"):
+            tEnv.step(0, choice = 99)
+
 
 if __name__ == '__main__':
     unittest.main()
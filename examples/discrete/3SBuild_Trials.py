@@ -10,6 +10,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 
 import scripts.GMEnv as sim
 import scripts.Tester as test
+import scripts.Solver as solver
 import unittest
 
 
@@ -31,8 +32,14 @@ class TestSum(unittest.TestCase):
     
     learningOptimal = 0
     learningParams = 0
+    learningStats = 0
     dtGologOptimal = 0.47599999999999987
     
+    @classmethod
+    def setUpClass(cls):
+        # The optimum learning is held to, computed from the domain.
+        cls.solvedOptimal = solver.solveDomain("./examples/discrete/3Build.pl")["value"]
+
     def setUp(self):
         self.env = sim.GMEnv("./examples/discrete/3Build.pl")
         self.env.setDebug(False)
@@ -55,7 +62,35 @@ class TestSum(unittest.TestCase):
         """
         result = self.t.simulate(self.simOptimalIter,[0,2])
         TestSum.simOptimal = result
-            
+
+    def test_optimalSimProlog(self):
+        """
+        The crude policy simulated within Prolog converges to the same value.
+        """
+        result = self.t.simulate(10000,[0,2],inProlog = True)
+        self.assertAlmostEqual(result, self.t.evaluate_exact([0,2]), places = 1)
+
+    def test_optimalSimAdaptive(self):
+        """
+        The crude policy simulated until the confidence interval is tight
+        enough covers the exact value.
+        """
+        mean, (low, high), episodes = self.t.simulateAdaptive(0.02, maxEpisodes = 10000, policy = [0,2], seed = 123)
+        self.assertLessEqual(episodes, 10000)
+        self.assertTrue(low - 0.01 <= self.t.evaluate_exact([0,2]) <= high + 0.01)
+
+    def test_simSummary(self):
+        """
+        Every episode is recorded and the summary agrees with the records.
+        """
+        summary = self.t.simulate(self.simRandomIter, forgivePenalty = False, summary = True)
+        self.assertEqual(summary["episodes"], self.simRandomIter)
+        self.assertEqual(len(self.t.episodes), self.simRandomIter)
+        self.assertAlmostEqual(summary["mean"], self.t.episodes["reward"].mean())
+        self.assertTrue((self.t.episodes["length"] >= 1).all())
+        self.assertTrue((self.t.episodes["infeasible"] <= 1).all())
+        self.assertLessEqual(summary["percentiles"][5], summary["percentiles"][95])
+
     def test_randonSimForgive(self):
         """
         A random policy (actions are picked randomly)
@@ -91,22 +126,25 @@ class TestSum(unittest.TestCase):
         None.
  
         """
-        result, params = self.t.test_learning(self.trainingIter,self.testingIter, logging = self.learningLoggingInterval, algo = self.learningAlgorithm)
+        result, params, stats = self.t.test_learning(self.trainingIter,self.testingIter, logging = self.learningLoggingInterval, algo = self.learningAlgorithm)
         TestSum.learningOptimal = result
         TestSum.learningParams = params
+        TestSum.learningStats = stats
         self.assertAlmostEqual(result,
-                          self.dtGologOptimal, 
+                          self.solvedOptimal, 
                           places = 0,
-                          msg = "\n Learning failed: {} expected, {} observed".format(TestSum.dtGologOptimal,result))
+                          msg = "\n Learning failed: {} expected, {} observed".format(TestSum.solvedOptimal,result))
   
     @classmethod
     def tearDownClass(cls):
         print('DT-Golog - calculated policy reward: {}'.format(cls.dtGologOptimal))
+        print('Solver - optimal expected reward...: {}'.format(cls.solvedOptimal))
         print('DT-Golog - simulated policy reward.: {}'.format(cls.simOptimal))
         print('Random simulated policy reward.....: {}'.format(cls.simRandom))
         print('Random simulated policy reward (fg): {}'.format(cls.simRandomForgive))
         print('Learned policy reward..............: {}'.format(cls.learningOptimal))
         print('--> Learning Parameters: \n {}'.format(cls.learningParams))
+        print('--> Learning Throughput: \n {}'.format(cls.learningStats))
 
      
 if __name__ == '__main__':
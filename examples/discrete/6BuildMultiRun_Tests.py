@@ -8,6 +8,8 @@ Created on Mon Sep 19 11:22:43 2022
 
 import scripts.GMEnv as sim
 import scripts.Tester as test
+import numpy as np
+import copy
 import unittest
 
 
@@ -73,6 +75,38 @@ class TestSum(unittest.TestCase):
                          msg = "\n (TestID: {}) - Wrong 'TransState' status: {} expected, {} observed".format(ID,transState,info["TransState"]))
 
 
+    def test_cache(self):
+        # Cached query results must be what the engine answers, including for 
+        # the same history under another cross-run state in a later run.
+        # Masked, so that the sampled actions always have a valid one to pick.
+        envC = sim.GMEnv("./examples/discrete/6BuildMultiRun.pl", cacheSize = 1000, masked = True)
+        self.env.setMasked(True)
+        traces = {}
+        for e in [self.env, envC]:
+            rng = np.random.default_rng(7)
+            trace = []
+            for seed in range(20):
+                e.reset(seed = seed)
+                done = False
+                while not done:
+                    action = int(rng.choice(np.flatnonzero(e.action_masks())))
+                    # Copies, as GMEnv's info refers to lists it goes on changing.
+                    step = copy.deepcopy(e.step(action))
+                    trace.append(step)
+                    done = step[2]
+            traces[e] = trace
+        self.assertEqual(len(traces[self.env]), len(traces[envC]))
+        self.assertTrue(any(info["Run"] > 0 for _, _, _, _, info in traces[envC]))
+        for i, ((sO, rO, dO, _, iO), (sC, rC, dC, _, iC)) in enumerate(zip(traces[self.env], traces[envC])):
+            self.assertEqual(sO, sC, msg = "\n (Step: {}) - Wrong state".format(i))
+            self.assertAlmostEqual(rO, rC, places = 6, msg = "\n (Step: {}) - Wrong reward".format(i))
+            self.assertEqual(dO, dC, msg = "\n (Step: {}) - Wrong 'done' status".format(i))
+            for k in ["stAction", "bitState", "tH", "eH", "Run", "Achieved", "TransState", "is_success"]:
+                self.assertEqual(iO[k], iC[k], msg = "\n (Step: {}) - Info {} differs".format(i, k))
+            self.assertEqual(list(iO["action_mask"]), list(iC["action_mask"]))
+        self.assertGreater(envC.qmi.hits, 0)
+        envC.closeQE()
+
     def test_various(self):
         
         self.takeStep(action = 0,
@@ -10,6 +10,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 
 import scripts.GMEnv as sim
 import scripts.Tester as test
+import scripts.Solver as solver
 import unittest
 
 
@@ -31,8 +32,14 @@ class TestSum(unittest.TestCase):
     
     learningOptimal = 0
     learningParams = 0
+    learningStats = 0
     dtGologOptimal = 0.928199999999999
     
+    @classmethod
+    def setUpClass(cls):
+        # The optimum learning is held to, computed from the domain.
+        cls.solvedOptimal = solver.solveDomain("./examples/discrete/6BuildMultiRun.pl")["value"]
+
     def setUp(self):
         self.env = sim.GMEnv("./examples/discrete/6BuildMultiRun.pl")
         self.env.setDebug(False)
@@ -81,6 +88,14 @@ class TestSum(unittest.TestCase):
         result = self.t.simulate(self.simRandomIter,forgivePenalty=False)
         TestSum.simRandomForgive = result
         
+    def test_exact(self):
+        """
+        The exact expected reward of the crude policy, over both runs, is what
+        a long simulation within Prolog converges to.
+        """
+        result = self.t.simulate(10000,[0,2,0,2],inProlog = True)
+        self.assertAlmostEqual(result, self.t.evaluate_exact([0,2,0,2]), places = 1)
+
     
     def test_learning(self):
         """
@@ -91,24 +106,27 @@ class TestSum(unittest.TestCase):
         None.
 
         """
-        result, params = self.t.test_learning(self.trainingIter,self.testingIter, logging = self.learningLoggingInterval, algo = self.learningAlgorithm)
+        result, params, stats = self.t.test_learning(self.trainingIter,self.testingIter, logging = self.learningLoggingInterval, algo = self.learningAlgorithm)
         TestSum.learningOptimal = result
         TestSum.learningParams = params
+        TestSum.learningStats = stats
         self.assertAlmostEqual(result,
-                          self.dtGologOptimal, 
+                          self.solvedOptimal, 
                           places = 0,
-                          msg = "\n Learning failed: {} expected, {} observed".format(TestSum.dtGologOptimal,result))
+                          msg = "\n Learning failed: {} expected, {} observed".format(TestSum.solvedOptimal,result))
             
 
     @classmethod
     def tearDownClass(cls):
         print('DT-Golog - calculated policy reward: {}'.format(cls.dtGologOptimal))
+        print('Solver - optimal expected reward...: {}'.format(cls.solvedOptimal))
         #print('DT-Golog - simulated policy reward : {}'.format(cls.simOptimal))
         print('Partially optimal policy reward....: {}'.format(cls.simCustom))
         print('Random policy reward.............. : {}'.format(cls.simRandom))
         print('Random policy reward.(fg)......... : {}'.format(cls.simRandomForgive))
         print('Learned policy reward..............: {}'.format(cls.learningOptimal))
         print('--> Learning Parameters: \n {}'.format(cls.learningParams))
+        print('--> Learning Throughput: \n {}'.format(cls.learningStats))
 
 
 if __name__ == '__main__':
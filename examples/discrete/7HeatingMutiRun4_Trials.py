@@ -8,6 +8,7 @@ Created on Mon Sep 19 11:22:43 2022
 
 import scripts.GMEnv as sim
 import scripts.Tester as test
+import scripts.Solver as solver
 import unittest
 import sys
 
@@ -28,8 +29,14 @@ class TestSum(unittest.TestCase):
     
     learningOptimal = 0
     learningParams = 0
+    learningStats = 0
     dtGologOptimal = -1.360857084
     
+    @classmethod
+    def setUpClass(cls):
+        # The optimum learning is held to, computed from the domain.
+        cls.solvedOptimal = solver.solveDomain("./examples/discrete/7HeatingMultiRun4.pl")["value"]
+
     def setUp(self):
         self.env = sim.GMEnv("./examples/discrete/7HeatingMultiRun4.pl")
         self.env.setDebug(False)
@@ -87,13 +94,14 @@ class TestSum(unittest.TestCase):
         None.
 
         """
-        result, params = self.t.test_learning(self.trainingIter,self.testingIter, logging = self.learningLoggingInterval, algo = self.learningAlgorithm)
+        result, params, stats = self.t.test_learning(self.trainingIter,self.testingIter, logging = self.learningLoggingInterval, algo = self.learningAlgorithm)
         TestSum.learningOptimal = result
         TestSum.learningParams = params
+        TestSum.learningStats = stats
         self.assertAlmostEqual(result,
-                          self.dtGologOptimal, 
+                          self.solvedOptimal, 
                           places = 0,
-                          msg = "\n Learning failed: {} expected, {} observed".format(TestSum.dtGologOptimal,result))
+                          msg = "\n Learning failed: {} expected, {} observed".format(TestSum.solvedOptimal,result))
             
 
     def test_advancedpolicy(self):
@@ -121,12 +129,14 @@ class TestSum(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         print('DT-Golog - calculated policy reward: {}'.format(cls.dtGologOptimal))
+        print('Solver - optimal expected reward...: {}'.format(cls.solvedOptimal))
         print('DT-Golog - simulated policy reward : {}'.format(cls.simOptimal))
         print('Partially optimal policy reward....: {}'.format(cls.simCustom))
         print('Random policy reward.............. : {}'.format(cls.simRandom))
         print('Random simulated policy reward (fg): {}'.format(cls.simRandomForgive))
         print('Learned policy reward..............: {}'.format(cls.learningOptimal))
         print('--> Learning Parameters: \n {}'.format(cls.learningParams))
+        print('--> Learning Throughput: \n {}'.format(cls.learningStats))
 
 
 
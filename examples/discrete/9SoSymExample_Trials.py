@@ -8,6 +8,7 @@ Created on Mon Sep 19 11:22:43 2022
 
 import scripts.GMEnv as sim
 import scripts.Tester as test
+import scripts.Solver as solver
 import unittest
 #from stable_baselines3 import A2C
 
@@ -30,8 +31,14 @@ class TestSum(unittest.TestCase):
     
     learningOptimal = 0
     learningParams = 0
+    learningStats = 0
     dtGologOptimal = 0.7910615000000001    
 
+    @classmethod
+    def setUpClass(cls):
+        # The optimum learning is held to, computed from the domain.
+        cls.solvedOptimal = solver.solveDomain("./examples/discrete/9SoSymExample.pl")["value"]
+
     def setUp(self):
         self.env = sim.GMEnv("./examples/discrete/9SoSymExample.pl")
         self.env.setDebug(False)
@@ -89,22 +96,25 @@ class TestSum(unittest.TestCase):
         None.
   
         """
-        result, params = self.t.test_learning(self.trainingIter,self.testingIter, logging = self.learningLoggingInterval, algo = self.learningAlgorithm)
+        result, params, stats = self.t.test_learning(self.trainingIter,self.testingIter, logging = self.learningLoggingInterval, algo = self.learningAlgorithm)
         TestSum.learningOptimal = result
         TestSum.learningParams = params
+        TestSum.learningStats = stats
         self.assertAlmostEqual(result,
-                          self.dtGologOptimal, 
+                          self.solvedOptimal, 
                           places = 0,
-                          msg = "\n Learning failed: {} expected, {} observed".format(TestSum.dtGologOptimal,result))
+                          msg = "\n Learning failed: {} expected, {} observed".format(TestSum.solvedOptimal,result))
   
     @classmethod
     def tearDownClass(cls):
         print('DT-Golog - calculated policy reward: {}'.format(cls.dtGologOptimal))
+        print('Solver - optimal expected reward...: {}'.format(cls.solvedOptimal))
         print('DT-Golog - simulated policy reward.: {}'.format(cls.simOptimal))
         print('Random simulated policy reward.....: {}'.format(cls.simRandom))
         print('Random simulated policy reward (fg): {}'.format(cls.simRandomForgive))
         print('Learned policy reward..............: {}'.format(cls.learningOptimal))
         print('--> Learning Parameters: \n {}'.format(cls.learningParams))
+        print('--> Learning Throughput: \n {}'.format(cls.learningStats))
 
 
 if __name__ == '__main__':
@@ -6,16 +6,51 @@ Created on Fri Jun  3 14:55:13 2022
 """
 
 from gymnasium import Env
-from gymnasium.spaces import Discrete, Box
+from gymnasium.spaces import Discrete, Box, MultiBinary, MultiDiscrete
 import numpy as np
 from .QE.QueryEngine import QueryEngine
+from .QE.CachedQMI import CachedQMI
+
+def seededGenerator(seed):
+    # A Generator of its own for an environment, drawing the very numbers 
+    # np.random.seed(seed) would have made the global functions draw, so 
+    # that seeded episodes unfold as they always did.
+    bitGenerator = np.random.MT19937()
+    bitGenerator.state = np.random.RandomState(seed).get_state(legacy = False)
+    return np.random.Generator(bitGenerator)
 
 class GMEnv(Env):
 
-    def __init__(self,file):
+    def __init__(self,file,progression = False,tabling = False,cacheSize = 0,qlfCache = False,qmi = None,obsMode = "discrete",infoLevel = "debug",masked = False):
 #        file = "../Examples/1Order.pl"
         
-        self.qmi  = QueryEngine(file)
+        # progression: have the query engine progress the state after each 
+        # step rather than regress over the history (see QueryEngine).
+        # tabling: have the query engine table fluents and attainment 
+        # formulae (see QueryEngine).
+        # cacheSize: if positive, remember up to that many query results 
+        # across steps and episodes (see CachedQMI).
+        # qlfCache: load the interface and domain from compiled quick load 
+        # files when up to date (see QueryEngine).
+        # qmi: an already constructed query engine for file to use instead, 
+        # e.g. one of a QueryEnginePool; progression, tabling and qlfCache 
+        # then do not apply, and closing is left to its owner (see closeQE).
+        # obsMode: how discrete domains present their state (see the 
+        # observation space below); continuous domains ignore it.
+        # infoLevel: how much step() reports in info (see stepInfo).
+        # masked: the episode is played through action_masks(), as by 
+        # MaskablePPO or masked simulations (see done()).
+        # The arguments another process needs to build the same environment.
+        self.file = file
+        self.envArgs = {"progression": progression, "tabling": tabling, "cacheSize": cacheSize, 
+                        "qlfCache": qlfCache, "obsMode": obsMode, "infoLevel": infoLevel, "masked": masked}
+        # A query engine given by the caller cannot be rebuilt from the above.
+        self.givenQMI = qmi is not None
+        if (qmi is None):
+            qmi = QueryEngine(file, progression = progression, tabling = tabling, qlfCache = qlfCache)
+        self.qmi  = qmi
+        if (cacheSize > 0):
+            self.qmi = CachedQMI(self.qmi, cacheSize)
        
         # Consider the following goal model:
         # Root
@@ -40,6 +75,10 @@ class GMEnv(Env):
         # e.g. [[]], [[3]], [[3,7],[]],  [[3,7],[2]] (consistent with above)
         self.eH = [[]];
 
+        # Handle to the situation of the latest run, kept on the Prolog side 
+        # and extended by one effect per step (see QMI.advance).
+        self.sitHandle = self.qmi.newHandle()
+
         # The list of possible *agent* actions at the current state.
         self.possAgentActions = [];
         
@@ -59,6 +98,12 @@ class GMEnv(Env):
 
         # The accrued reward of the current episode
         self.reward = 0;
+
+        # What Prolog knows about the current situation (reward, state, done, 
+        # achieved, and trans state and mask if asked for), as returned by a 
+        # single stepInfo query. None if the situation changed since it was 
+        # last retrieved.
+        self.sitInfo = None
         
         # The amount of penalty to apply if the agent tries an 
         # infeasible action.
@@ -70,13 +115,19 @@ class GMEnv(Env):
         self.terminateEpisode = False #is the current episode to be terminated?
 
         # Keep the hard-coded initial state for resetting.
-        self.initTransState = self.qmi.getTransState(self.eHString())
+        self.initTransState = self.qmi.getTransState(self.sitHandle)
+        # The cross-run state currently asserted in the query engine.
+        self.transState = self.initTransState
 
-        # Set the default seed for np.
+        # The default seed of the environment's random number generator 
+        # (set once the action space exists, see setSeed).
         self.defaultSeed = 123
-        np.random.seed(self.defaultSeed)
 
         self.debug = False
+        if infoLevel not in ("minimal", "standard", "debug"):
+            raise ValueError("Unknown info level: {}".format(infoLevel))
+        self.infoLevel = infoLevel
+        self.masked = masked
         
         # Obtain domain parameters from Query Engine
         self.actionSize, self.stateSize, self.initBitState, self.obsType, self.runsNum = self.qmi.getDomainParams()
@@ -90,8 +141,10 @@ class GMEnv(Env):
 
         #  A C T I O N    S P A C E 
         self.action_space = Discrete(self.actionSize)     
+        self.setSeed(self.defaultSeed)
         
         # O B S E R V A T I O N     S P A C E
+        self.obsMode = obsMode
         if (self.obsType == "continuous"):
             shapeInfo = self.qmi.getStateShapeInfo()
             self.obsMins = shapeInfo['Min']
@@ -101,24 +154,41 @@ class GMEnv(Env):
                                     high = np.array(self.obsMaxs)
                                     )
         else: # Discrete space envioronments don't have shape info.
-            self.observation_space = Discrete(self.stateSize)
+            # discrete: the bits of all runs read as one integer, 
+            #   i.e. 2^(bits*runs) states.
+            # multibinary: the bits of all runs as a 0/1 vector.
+            # compact: the bits of the current run followed by the run index.
+            bits = len(self.initBitState[0])
+            if (obsMode == "discrete"):
+                self.observation_space = Discrete(self.stateSize)
+            elif (obsMode == "multibinary"):
+                self.observation_space = MultiBinary(bits*self.runsNum)
+            elif (obsMode == "compact"):
+                self.observation_space = MultiDiscrete([2]*bits + [self.runsNum + 1])
+            else:
+                raise ValueError("Unknown observation mode: {}".format(obsMode))
             self.obsMins = -1
             self.obsMaxs = -1
         
     def reset(self, seed=None, options=None):
         # Reset the episode
+        if (seed is not None):
+            self.setSeed(seed)
         self.eH = [[]];
         self.tH = [[]];
         self.bitState = self.initBitState.copy();
         self.qmi.setTransState(self.initTransState)
+        self.transState = self.initTransState
+        self.qmi.resetHandle(self.sitHandle)
         self.terminateEpisode = False
         self.run = 0;
         self.reward = 0;
+        self.sitInfo = None
         
         if (self.obsType == "discrete"):
-            newState = self.constructStateInt(self.bitState)
+            newState = self.observation()
         else:
-            newState = self.qmi.getConState(self.eHString())
+            newState = self.situationInfo()["CCState"]
         
         return newState, {}
 
@@ -131,7 +201,7 @@ class GMEnv(Env):
             return (False)
         else:
             # Check if the action is possible in this run
-            return (self.qmi.possibleAt(action, self.eHString()))
+            return (self.qmi.possibleAt(action, self.sitHandle))
 
     def step(self, action, choice = -1):
         
@@ -140,11 +210,11 @@ class GMEnv(Env):
         if (self.possible(action)):
             # Get the outcomes and probabilities (stochastic actions) of the agent action
             #realAction = self.getCopy(action)
-            possStochActions, probs = self.qmi.getOutcomes(action,self.eHString())
+            possStochActions, probs = self.qmi.getOutcomes(action,self.sitHandle)
             
             # Pick one of the choices according to the probability
             if (choice == -1):
-                stAction = np.random.choice(possStochActions,1,p=probs)[0]
+                stAction = self.np_random.choice(possStochActions,1,p=probs)[0]
             else:
                 stAction = choice
             #print("--> Chose Action: {} (choice was {})".format(stAction,choice))
@@ -152,6 +222,8 @@ class GMEnv(Env):
             # of performed actions for the run
             self.tH[self.run].append(action)
             self.eH[self.run].append(stAction)
+            self.qmi.advance(self.sitHandle, stAction)
+            self.sitInfo = None
             #print("--> Acquiring reward for: {}".format(self.eHString()))
             #print('--> State List: {}'.format(self.bitState))
             #print('--> History: {}'.format(self.tH))
@@ -160,9 +232,10 @@ class GMEnv(Env):
             # if (self.qmi.done(self.eHString()) and not self.achieved()):
             #     self.reward = self.inFeasiblePenalty
             # else:
-            self.reward = self.qmi.reward(self.eHString())
+            # Reward, state, done etc. of the new situation all come from one query.
+            self.reward = self.situationInfo()["Reward"]
                 
-            self.bitState[self.run] = self.qmi.getState(self.eHString())
+            self.bitState[self.run] = self.situationInfo()["State"]
                 
         else: # The action is not possible
             self.reward = self.inFeasiblePenalty
@@ -170,29 +243,21 @@ class GMEnv(Env):
                 self.terminateEpisode = True
             
         if (self.obsType == "continuous"):
-            newState = self.qmi.getConState(self.eHString())
+            newState = self.situationInfo()["CCState"]
         
         if (self.runConcluded()):
             if (self.run <= self.runsNum - 1):
                 self.advanceRun()    
             
         if (self.obsType == "discrete"):
-            newState = self.constructStateInt(self.bitState)
+            newState = self.observation()
         #else:
         #    newState = self.qmi.getConState(self.eHString())
 
         terminated = self.done()
         truncated = False
 
-        inf = {"stAction":stAction,
-               "bitState":self.bitState,
-               "tH":self.tH,
-               "eH":self.eH,
-               "Run":self.run,
-               "Achieved":self.achieved(),
-               "TransState": self.qmi.getTransState(self.eHString()),
-               "is_success": ((self.run == self.runsNum))
-               }
+        inf = self.stepInfo(stAction)
 
         if (self.debug):
             print(' ')
@@ -207,22 +272,140 @@ class GMEnv(Env):
             print('--> Reward: {}'.format(self.reward))
             print('--> Episode Done: {}'.format(self.done()))
             print('--> Goal Achieved: {}'.format(self.achieved()))
-            print('--> TransState: {}'.format(inf['TransState']))
+            print('--> TransState: {}'.format(self.situationField("TransState")))
             #print("--> Initial state {}".format(self.initBitState))
         
         return newState, self.reward, terminated, truncated, inf
 
+    def stepInfo(self, stAction):
+        # The info of step(), as detailed as infoLevel asks:
+        # minimal: stAction, Run and is_success, without any further query.
+        # standard: adds bitState, tH, eH and Achieved, all known by now, but
+        #   neither TransState nor action_mask (see action_masks()): learners 
+        #   copy or pickle every info, so they would be computed on every step.
+        # debug (the default): everything.
+        if (self.infoLevel == "minimal"):
+            return {"stAction":stAction,
+                    "Run":self.run,
+                    "is_success": ((self.run == self.runsNum))}
+        inf = {"stAction":stAction,
+               "bitState":self.bitState,
+               "tH":self.tH,
+               "eH":self.eH,
+               "Run":self.run,
+               "Achieved":self.achieved(),
+               "is_success": ((self.run == self.runsNum))
+               }
+        if (self.infoLevel == "standard"):
+            return inf
+        inf["TransState"] = self.situationField("TransState")
+        inf["action_mask"] = self.action_masks()
+        return inf
+
     def done(self):
         assert(self.run <= self.runsNum)
         #print("Run {} for {} is done? {}".format(self.run,self.eHString(),self.qmi.done(self.eHString())))
-        return (self.qmi.done(self.eHString()) or (self.run == self.runsNum) or self.terminateEpisode )
+        # The checks that need no query first. A masked episode also ends once 
+        # every action possible in the run has been attempted: a mask without 
+        # any valid action is of no use to a learner. Unmasked, the agent is 
+        # left to attempt one and earn the infeasible action penalty.
+        return (self.terminateEpisode or (self.run == self.runsNum) or self.situationInfo()["Done"]
+                or (self.masked and not self.maskOf(self.situationField("Mask"), self.tH[self.run]).any()))
             
     def render(self):
         # Visualization not implemented
         pass
 
     def achieved(self):
-        return self.qmi.achieved(self.eHString())
+        return self.situationInfo()["Achieved"]
+
+    def action_masks(self):
+        # Which actions step() would accept now: possible in the current 
+        # situation and not yet attempted in the run. Named after the method
+        # sb3-contrib's MaskablePPO looks for. In masked mode, at least one 
+        # is valid unless the episode is done (see done()).
+        if (self.done()):
+            return np.zeros(self.actionSize, dtype = bool)
+        return self.maskOf(self.situationField("Mask"), self.tH[self.run])
+
+    def maskOf(self, feasible, tried):
+        mask = np.array(feasible, dtype = bool)
+        mask[tried] = False
+        return mask
+
+    def situationInfo(self):
+        # Query Prolog about the current situation only once, no matter how 
+        # many of its aspects are needed until the situation changes again.
+        # The trans state and the mask (a poss/2 check of every action) are 
+        # only part of the query if every step will need them: for the info
+        # of debug level, and the masks of masked episodes.
+        if (self.sitInfo is None):
+            fields = ()
+            if (self.infoLevel == "debug"):
+                fields = ("TransState", "Mask")
+            elif (self.masked):
+                fields = ("Mask",)
+            self.sitInfo = self.qmi.stepInfo(self.sitHandle, fields)
+        return self.sitInfo
+
+    def situationField(self, key):
+        # The trans state or the mask of the current situation, queried on 
+        # its own when the situation's query left it out.
+        info = self.situationInfo()
+        if (key not in info):
+            if (key == "TransState"):
+                info[key] = self.qmi.getTransState(self.sitHandle)
+            else:
+                info[key] = self.qmi.feasibleMask(self.sitHandle)
+        return info[key]
+
+    # The observation of a discrete domain, encoded as per obsMode
+    def observation(self):
+        if (self.obsMode == "multibinary"):
+            return np.array(self.flatten(self.bitState), dtype = np.int8)
+        elif (self.obsMode == "compact"):
+            # Once all runs are over, the last one is still the one shown.
+            current = self.bitState[min(self.run, self.runsNum - 1)]
+            return np.array(current + [self.run], dtype = np.int64)
+        else:
+            return self.constructStateInt(self.bitState)
+
+    #
+    # S N A P S H O T S
+    #
+
+    def snapshot(self):
+        # A token from which restore() brings the episode back to where it 
+        # is now. It holds copies of the episode state only, no query engine 
+        # resources, so any number of them can be kept (and pickled).
+        sitInfo = None
+        if (self.sitInfo is not None):
+            sitInfo = {k: (list(v) if isinstance(v, list) else v) for k, v in self.sitInfo.items()}
+        return {"eH": [list(x) for x in self.eH],
+                "tH": [list(x) for x in self.tH],
+                "run": self.run,
+                "bitState": [list(x) for x in self.bitState],
+                "reward": self.reward,
+                "terminateEpisode": self.terminateEpisode,
+                "transState": self.transState,
+                "sitInfo": sitInfo}
+
+    def restore(self, token):
+        # Continue from the state captured by snapshot(). Costs one query for 
+        # the situation handle, plus two if the cross-run state differs.
+        self.eH = [list(x) for x in token["eH"]]
+        self.tH = [list(x) for x in token["tH"]]
+        self.run = token["run"]
+        self.bitState = [list(x) for x in token["bitState"]]
+        self.reward = token["reward"]
+        self.terminateEpisode = token["terminateEpisode"]
+        if (token["transState"] != self.transState):
+            self.transState = token["transState"]
+            self.qmi.setTransState(self.transState)
+        self.qmi.setHandle(self.sitHandle, self.eH[self.run])
+        self.sitInfo = None
+        if (token["sitInfo"] is not None):
+            self.sitInfo = {k: (list(v) if isinstance(v, list) else v) for k, v in token["sitInfo"].items()}
 
     # Construct State Integer from bitState, run and stateSize
     def constructStateInt(self, bS):
@@ -236,8 +419,17 @@ class GMEnv(Env):
     def setImpossibleActionPenalty(self,penalty):
         self.inFeasiblePenalty = penalty
 
+    def setMasked(self,status):
+        # Whether the episode is played through action_masks() (see done()).
+        self.masked = status
+        self.envArgs["masked"] = status
+
     def setSeed(self,newSeed):
-        np.random.seed(newSeed)
+        # Outcomes are sampled from the environment's own generator, and 
+        # random policies from its action space: neither is shared with 
+        # other environments of the process.
+        self.np_random = seededGenerator(newSeed)
+        self.action_space.seed(newSeed)
         
     def bitToNum(self,l = []):
         # binary list to integer conversion
@@ -269,14 +461,27 @@ class GMEnv(Env):
     def advanceRun(self):
         # Grab trans values from the latest eH state and assert them to the new
         #print("Copying Transstate {}".format(self.qmi.getTransState(self.eHString())))
-        self.qmi.setTransState(self.qmi.getTransState(self.eHString()))
+        self.transState = self.situationField("TransState")
+        self.qmi.setTransState(self.transState)
         self.run = self.run + 1
         self.tH.append([])
         self.eH.append([])
+        self.qmi.resetHandle(self.sitHandle)
+        self.sitInfo = None
         
         
+    def getQueryTime(self):
+        # Seconds spent in the query engine so far (see QueryEngine.getQueryTime).
+        return self.qmi.getQueryTime()
+
     def closeQE(self):
-        self.qmi.close()
+        self.qmi.freeHandle(self.sitHandle)
+        if not self.givenQMI:
+            self.qmi.close()
+        else:
+            # Leave a given engine with the cross-run state it was given with,
+            # which the next environment on it takes for the initial one.
+            self.qmi.setTransState(self.initTransState)
 
     #
     #
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Environment stepping from the precomputed tables of an exported MDP.
+
+@author: Anonymous
+"""
+
+from gymnasium import Env
+from gymnasium.spaces import Discrete, Box, MultiBinary, MultiDiscrete
+import numpy as np
+import time
+from .MDPExport import MDPExporter, loadMDP
+from .GMEnv import seededGenerator
+
+
+class GMTableEnv(Env):
+    """
+    A drop-in replacement of GMEnv that looks transitions up in the arrays
+    written by MDPExporter instead of querying Prolog. Observations, rewards,
+    termination, infeasible action penalties, run advancement and info follow
+    GMEnv, and so does the sampling of outcomes: under the same seed both draw
+    the same effects.
+    """
+
+    def __init__(self,source,obsMode = "discrete",masked = False,infoLevel = "debug"):
+        """
+        Parameters
+        ----------
+        source : String or dict
+            An .npz file written by MDPExporter.export(), a domain specification
+            (.pl) to be explored on construction, or the arrays themselves.
+        obsMode : String, optional
+            As in GMEnv. The default is "discrete".
+        masked : boolean, optional
+            As in GMEnv. The default is False.
+        infoLevel : String, optional
+            As in GMEnv: "minimal", "standard" or "debug". The default is "debug".
+        """
+        if infoLevel not in ("minimal", "standard", "debug"):
+            raise ValueError("Unknown info level: {}".format(infoLevel))
+        start = time.perf_counter()
+        if isinstance(source, dict):
+            mdp = source
+        elif source.endswith(".npz"):
+            mdp = loadMDP(source)
+        else:
+            exporter = MDPExporter(source)
+            mdp = exporter.explore()
+            exporter.close()
+            mdp = {k: (v.item() if v.ndim == 0 else v) for k, v in mdp.items()}
+        self.compileTime = time.perf_counter() - start
+        # What another process needs to build the same environment, as with 
+        # GMEnv: the archive, or else the arrays themselves rather than explore 
+        # the domain again.
+        self.file = source if (isinstance(source, str) and source.endswith(".npz")) else mdp
+        self.envArgs = {"obsMode": obsMode, "masked": masked, "infoLevel": infoLevel}
+        # No query engine: what needs Prolog (rollouts within Prolog, exact 
+        # policy evaluation) is not available.
+        self.qmi = None
+
+        self.actionSize = mdp["actionSize"]
+        self.runsNum = mdp["runsNum"]
+        self.obsType = mdp["obsType"]
+        self.inFeasiblePenalty = mdp["penalty"]
+        self.defaultPenalty = mdp["penalty"]
+        bits = mdp["stateSizeBits"]
+        self.stateSize = 2**(bits*self.runsNum)
+        self.obsMode = obsMode
+        self.masked = masked
+        self.infoLevel = infoLevel
+
+        # Transitions grouped by (state, action), outcomes in their original
+        # order: those of (s,a) are at offsets[s*actionSize+a] up to the next.
+        order = np.lexsort((mdp["P_a"], mdp["P_s"]))
+        keys = mdp["P_s"][order]*self.actionSize + mdp["P_a"][order]
+        self.offsets = np.searchsorted(keys, np.arange(len(mdp["done"])*self.actionSize + 1))
+        self.nextState = mdp["P_next"][order]
+        self.outReward = mdp["P_reward"][order]
+        self.outStoch = mdp["P_stoch"][order]
+        probs = mdp["P_prob"][order]
+        # Cumulative probabilities within each (state, action), normalized as
+        # Generator.choice does, so that sampling draws what GMEnv would.
+        self.cdf = np.empty_like(probs)
+        for first, last in zip(self.offsets[:-1], self.offsets[1:]):
+            if (last > first):
+                cdf = probs[first:last].cumsum()
+                self.cdf[first:last] = cdf/cdf[-1]
+
+        self.feasible = mdp["feasible"]
+        self.doneState = mdp["done"]
+        self.achievedState = mdp["achieved"]
+        self.stateRun = mdp["run"]
+        self.transState = mdp["transState"]
+        self.bitLists = [[list(map(int, row[r*bits:(r+1)*bits])) for r in range(self.runsNum)] for row in mdp["bits"]]
+        self.ccState = mdp["cc"]
+
+        #  A C T I O N    S P A C E
+        self.action_space = Discrete(self.actionSize)
+
+        # O B S E R V A T I O N     S P A C E
+        if (self.obsType == "continuous"):
+            self.obsMins = list(mdp["obsMins"])
+            self.obsMaxs = list(mdp["obsMaxs"])
+            self.observation_space = Box(low = np.array(self.obsMins), high = np.array(self.obsMaxs))
+        else:
+            if (obsMode == "discrete"):
+                self.observation_space = Discrete(self.stateSize)
+            elif (obsMode == "multibinary"):
+                self.observation_space = MultiBinary(bits*self.runsNum)
+            elif (obsMode == "compact"):
+                self.observation_space = MultiDiscrete([2]*bits + [self.runsNum + 1])
+            else:
+                raise ValueError("Unknown observation mode: {}".format(obsMode))
+            self.obsMins = -1
+            self.obsMaxs = -1
+            self.observations = [self.encode(b, r) for b, r in zip(self.bitLists, self.stateRun)]
+
+        self.defaultSeed = 123
+        self.setSeed(self.defaultSeed)
+        self.debug = False
+        self.reset()
+
+    def encode(self,bitState,run):
+        if (self.obsMode == "multibinary"):
+            return np.array(sum(bitState, []), dtype = np.int8)
+        elif (self.obsMode == "compact"):
+            return np.array(bitState[min(run, self.runsNum - 1)] + [run], dtype = np.int64)
+        else:
+            result = 0
+            for digit in sum(bitState, []):
+                result = (result << 1) | digit
+            return result
+
+    def observation(self):
+        if (self.obsType == "continuous"):
+            return list(self.ccState[self.state])
+        return self.observations[self.state]
+
+    def reset(self, seed=None, options=None):
+        if (seed is not None):
+            self.setSeed(seed)
+        self.state = 0
+        self.run = 0
+        self.tH = [[]]
+        self.eH = [[]]
+        self.reward = 0
+        self.terminateEpisode = False
+        return self.observation(), {}
+
+    def possible(self,action):
+        return (not self.done()) and self.feasible[self.state, action]
+
+    def step(self, action, choice = -1):
+        stAction = -1
+        if (self.possible(action)):
+            k = self.state*self.actionSize + action
+            start, end = self.offsets[k], self.offsets[k + 1]
+            if (choice == -1):
+                i = start + np.searchsorted(self.cdf[start:end], self.np_random.random(), side = "right")
+            else:
+                matches = np.flatnonzero(self.outStoch[start:end] == choice)
+                if (len(matches) == 0):
+                    raise ValueError("Outcome {} is not one of action {} in state {}: {} are"
+                                     .format(choice, action, self.state, [int(x) for x in self.outStoch[start:end]]))
+                i = start + int(matches[0])
+            stAction = int(self.outStoch[i])
+            self.tH[self.run].append(action)
+            self.eH[self.run].append(stAction)
+            self.reward = float(self.outReward[i])
+            self.state = int(self.nextState[i])
+            if (self.stateRun[self.state] != self.run):
+                # The run concluded.
+                self.run = int(self.stateRun[self.state])
+                self.tH.append([])
+                self.eH.append([])
+        else:
+            self.reward = self.inFeasiblePenalty
+            self.terminateEpisode = True
+
+        newState = self.observation()
+        terminated = self.done()
+        inf = self.stepInfo(stAction)
+
+        if (self.debug):
+            print(' ')
+            print('New Action Attempt:')
+            print('--> Action: {}'.format(action))
+            print('--> St. Action: {}'.format(stAction))
+            print('--> State Num: {}'.format(newState))
+            print('--> State List: {}'.format(self.bitLists[self.state]))
+            print('--> History: {}'.format(self.tH))
+            print('--> Situation: {}'.format(self.eH))
+            print('--> Run: {}'.format(self.run))
+            print('--> Reward: {}'.format(self.reward))
+            print('--> Episode Done: {}'.format(terminated))
+            print('--> Goal Achieved: {}'.format(self.achieved()))
+            print('--> TransState: {}'.format(self.transState[self.state]))
+
+        return newState, self.reward, terminated, False, inf
+
+    def stepInfo(self, stAction):
+        # The info of step(), with the keys of GMEnv.stepInfo() at each level.
+        if (self.infoLevel == "minimal"):
+            return {"stAction":stAction,
+                    "Run":self.run,
+                    "is_success": ((self.run == self.runsNum))}
+        inf = {"stAction":stAction,
+               "bitState":[list(b) for b in self.bitLists[self.state]],
+               "tH":self.tH,
+               "eH":self.eH,
+               "Run":self.run,
+               "Achieved":self.achieved(),
+               "is_success": ((self.run == self.runsNum))
+               }
+        if (self.infoLevel == "standard"):
+            return inf
+        inf["TransState"] = str(self.transState[self.state])
+        inf["action_mask"] = self.action_masks()
+        return inf
+
+    def done(self):
+        # As GMEnv.done(): a masked episode also ends with no valid action left.
+        return bool(self.doneState[self.state] or self.terminateEpisode
+                    or (self.masked and not self.feasible[self.state].any()))
+
+    def achieved(self):
+        return bool(self.achievedState[self.state])
+
+    def action_masks(self):
+        if (self.done()):
+            return np.zeros(self.actionSize, dtype = bool)
+        return self.feasible[self.state].copy()
+
+    def render(self):
+        pass
+
+    #
+    # S N A P S H O T S
+    #
+
+    def snapshot(self):
+        return {"state": self.state, "run": self.run,
+                "eH": [list(x) for x in self.eH], "tH": [list(x) for x in self.tH],
+                "reward": self.reward, "terminateEpisode": self.terminateEpisode}
+
+    def restore(self, token):
+        self.state = token["state"]
+        self.run = token["run"]
+        self.eH = [list(x) for x in token["eH"]]
+        self.tH = [list(x) for x in token["tH"]]
+        self.reward = token["reward"]
+        self.terminateEpisode = token["terminateEpisode"]
+
+    #
+    # M I S C    H E L P E R S
+    #
+
+    def setImpossibleActionPenalty(self,penalty):
+        self.inFeasiblePenalty = penalty
+
+    def getInfeasiblePenalty(self):
+        return self.defaultPenalty
+
+    def setMasked(self,status):
+        self.masked = status
+        self.envArgs["masked"] = status
+
+    def setSeed(self,newSeed):
+        self.np_random = seededGenerator(newSeed)
+        self.action_space.seed(newSeed)
+
+    def eHString(self):
+        return ",".join([str(x) for x in self.eH[self.run]])
+
+    def setDebug(self,status):
+        self.debug = status
+
+    def getQueryTime(self):
+        # No queries.
+        return 0.0
+
+    def closeQE(self):
+        # Nothing held on the Prolog side.
+        pass
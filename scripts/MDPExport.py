@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+Export of the reachable state space of a domain as an MDP in NumPy arrays.
+
+The exporter explores, breadth first from the reset state, every state the
+environment (GMEnv) can get into and records its transitions in sparse form.
+Solvers and analyses can then work on the arrays without going back to Prolog
+for every transition.
+
+@author: Anonymous
+"""
+
+from collections import deque
+import numpy as np
+from .QE.QueryEngine import QueryEngine
+
+
+class MDPExporter:
+    """
+    Breadth-first explorer of the states of a domain, following GMEnv semantics:
+    actions already attempted in the run or not possible are infeasible (they
+    earn the infeasible action penalty and end the episode), achieving the root
+    goal concludes the run and passes its cross-run state to the next one, and
+    the episode is over when the domain says so or all runs are concluded.
+
+    Histories are merged when they lead to the same state, i.e. the same run,
+    actions attempted in the run, fluent bits of all runs, continuous state and
+    cross-run state (both the one the run started with and the current one). The
+    export is hence exact only for domains whose reward and dynamics depend on
+    the history only through these. Unless told otherwise, every merged history
+    is checked against the one that represents its state (termination, mask and,
+    per feasible action, outcomes, probabilities, rewards and next states) and a
+    ValueError is raised if they disagree.
+    """
+
+    def __init__(self,file,qmi = None,maxStates = None,checkMerges = True):
+        """
+        Parameters
+        ----------
+        file : String
+            The path of the domain specification.
+        qmi : QueryEngine, optional
+            An already constructed query engine for file to use instead.
+        maxStates : integer, optional
+            Give up when more states than that are reached. The default is None (no limit).
+        checkMerges : boolean, optional
+            Check that merged histories agree with the state they are merged
+            into. The default is True.
+        """
+        self.file = file
+        if (qmi is None):
+            qmi = QueryEngine(file)
+        self.qmi = qmi
+        self.maxStates = maxStates
+        self.checkMerges = checkMerges
+        self.actionSize, _, self.initBitState, self.obsType, self.runsNum = self.qmi.getDomainParams()
+        self.penalty = self.qmi.getInfeasibleActionPenalty()
+        self.initTransState = self.qmi.getTransState("")
+        # The cross-run state currently asserted on the Prolog side.
+        self.transState = None
+        if (self.obsType == "continuous"):
+            shapeInfo = self.qmi.getStateShapeInfo()
+            self.obsMins = shapeInfo['Min']
+            self.obsMaxs = shapeInfo['Max']
+        else:
+            self.obsMins = []
+            self.obsMaxs = []
+
+    def useTransState(self,tS):
+        if (tS != self.transState):
+            self.qmi.setTransState(tS)
+            self.transState = tS
+
+    def situationInfo(self,node):
+        self.useTransState(node["startTrans"])
+        return self.qmi.stepInfo(",".join([str(x) for x in node["history"]]))
+
+    def stateKey(self,node,transState):
+        return (node["run"], node["tried"], tuple(tuple(b) for b in node["bitState"]),
+                tuple(node["cc"]), node["startTrans"], transState)
+
+    def expand(self,node,info):
+        """
+        The step from the state of node, given its stepInfo.
+
+        Returns
+        -------
+        done : boolean
+            Whether the episode is over.
+        row : numpy array of booleans
+            The feasible actions.
+        transitions : list
+            (action, outcome, probability, reward, next node, next cross-run state)
+            for every outcome of every feasible action.
+        """
+        done = info["Done"] or node["run"] == self.runsNum
+        row = np.zeros(self.actionSize, dtype = bool)
+        transitions = []
+        if not done:
+            row[:] = info["Mask"]
+            row[list(node["tried"])] = False
+        eH = ",".join([str(x) for x in node["history"]])
+        for a in np.flatnonzero(row):
+            a = int(a)
+            outcomes, probs = self.qmi.getOutcomes(a, eH)
+            for o, p in zip(outcomes, probs):
+                history = node["history"] + [o]
+                nextInfo = self.situationInfo(dict(node, history = history))
+                bitState = [list(b) for b in node["bitState"]]
+                bitState[node["run"]] = list(nextInfo["State"])
+                if nextInfo["Achieved"]:
+                    # The run is concluded: the next starts over with the
+                    # cross-run state reached.
+                    nextNode = {"run": node["run"] + 1, "tried": (), "bitState": bitState,
+                                "cc": list(nextInfo["CCState"]),
+                                "startTrans": nextInfo["TransState"], "history": []}
+                else:
+                    nextNode = {"run": node["run"], "tried": tuple(sorted(node["tried"] + (a,))),
+                                "bitState": bitState, "cc": list(nextInfo["CCState"]),
+                                "startTrans": node["startTrans"], "history": history}
+                transitions.append((a, o, p, nextInfo["Reward"], nextNode, nextInfo["TransState"]))
+        return done, row, transitions
+
+    def signature(self,node,info,expansion):
+        done, row, transitions = expansion
+        return (done, info["Achieved"], tuple(row),
+                tuple((a, o, p, r, self.stateKey(n, t)) for a, o, p, r, n, t in transitions))
+
+    def explore(self):
+        """
+        Explores the reachable states.
+
+        Returns
+        -------
+        dict
+            The MDP as arrays, in the layout described in export().
+        """
+        bits = len(self.initBitState[0])
+        # The state reached on reset.
+        root = {"run": 0, "tried": (), "bitState": [list(b) for b in self.initBitState],
+                "startTrans": self.initTransState, "history": []}
+        rootInfo = self.situationInfo(root)
+        root["cc"] = list(rootInfo["CCState"])
+
+        index = {}
+        nodes = []
+        # Histories merged into an existing state, to be checked against it.
+        merged = []
+        def stateIndex(node, transState):
+            key = self.stateKey(node, transState)
+            if key in index:
+                if self.checkMerges and (node["history"] != nodes[index[key]]["history"]):
+                    merged.append((index[key], node))
+            else:
+                if (self.maxStates is not None) and (len(nodes) >= self.maxStates):
+                    raise RuntimeError("More than {} reachable states".format(self.maxStates))
+                index[key] = len(nodes)
+                nodes.append(node)
+                queue.append(index[key])
+            return index[key]
+
+        queue = deque()
+        stateIndex(root, rootInfo["TransState"])
+
+        done, achieved, transStates, startTransStates = [], [], [], []
+        feasible, R, signatures = [], [], []
+        P_s, P_a, P_next, P_prob, P_reward, P_stoch = [], [], [], [], [], []
+
+        while queue:
+            s = queue.popleft()
+            node = nodes[s]
+            info = self.situationInfo(node)
+            expansion = self.expand(node, info)
+            isDone, row, transitions = expansion
+            done.append(isDone)
+            achieved.append(info["Achieved"])
+            transStates.append(info["TransState"])
+            startTransStates.append(node["startTrans"])
+            rewards = np.full(self.actionSize, self.penalty, dtype = np.float64)
+            rewards[row] = 0
+            for a, o, p, reward, nextNode, nextTrans in transitions:
+                P_s.append(s)
+                P_a.append(a)
+                P_next.append(stateIndex(nextNode, nextTrans))
+                P_prob.append(p)
+                P_reward.append(reward)
+                P_stoch.append(o)
+                rewards[a] += p*reward
+            if self.checkMerges:
+                signatures.append(self.signature(node, info, expansion))
+            feasible.append(row)
+            R.append(rewards)
+
+        # A merged history must agree with its state on the step from it, and
+        # so must the histories it leads to, down to the end of the episode.
+        while merged:
+            s, node = merged.pop()
+            info = self.situationInfo(node)
+            expansion = self.expand(node, info)
+            if self.signature(node, info, expansion) != signatures[s]:
+                raise ValueError("Histories {} and {} lead to the same state but differ in "
+                                 "termination, feasible actions, outcomes or rewards; the domain "
+                                 "cannot be exported".format(nodes[s]["history"], node["history"]))
+            for _, _, _, _, nextNode, nextTrans in expansion[2]:
+                stateIndex(nextNode, nextTrans)
+
+        return {"P_s": np.array(P_s, dtype = np.int64),
+                "P_a": np.array(P_a, dtype = np.int64),
+                "P_next": np.array(P_next, dtype = np.int64),
+                "P_prob": np.array(P_prob, dtype = np.float64),
+                "P_reward": np.array(P_reward, dtype = np.float64),
+                "P_stoch": np.array(P_stoch, dtype = np.int64),
+                "R": np.array(R, dtype = np.float64).reshape(-1, self.actionSize),
+                "feasible": np.array(feasible, dtype = bool).reshape(-1, self.actionSize),
+                "done": np.array(done, dtype = bool),
+                "achieved": np.array(achieved, dtype = bool),
+                "bits": np.array([sum(n["bitState"], []) for n in nodes], dtype = np.int8).reshape(len(nodes), bits*self.runsNum),
+                "cc": np.array([n["cc"] for n in nodes], dtype = np.float64).reshape(len(nodes), -1),
+                "run": np.array([n["run"] for n in nodes], dtype = np.int64),
+                "transState": np.array(transStates, dtype = str),
+                "startTransState": np.array(startTransStates, dtype = str),
+                "actionSize": np.array(self.actionSize),
+                "runsNum": np.array(self.runsNum),
+                "stateSizeBits": np.array(bits),
+                "obsType": np.array(self.obsType),
+                "penalty": np.array(self.penalty, dtype = np.float64),
+                "obsMins": np.array(self.obsMins, dtype = np.float64),
+                "obsMaxs": np.array(self.obsMaxs, dtype = np.float64),
+                "source": np.array(self.file)}
+
+    def export(self,path):
+        """
+        Explores the reachable states and writes them to a compressed .npz file.
+        State 0 is the one reached on reset.
+
+        Transitions are kept in coordinate form, one entry per outcome of a
+        feasible action: P_s, P_a, P_next, P_prob, P_reward (the reward of that
+        outcome) and P_stoch (the effect, i.e. nature action, behind it). Per
+        state and action: R (the expected reward, or the penalty if infeasible)
+        and feasible. Per state: done, achieved, bits (of all runs), cc
+        (continuous state), run, transState and startTransState. The domain
+        parameters are kept as scalars (actionSize, runsNum, stateSizeBits,
+        obsType, penalty, obsMins, obsMaxs, source).
+
+        Parameters
+        ----------
+        path : String
+            Where to write the file.
+
+        Returns
+        -------
+        dict
+            The exported arrays.
+        """
+        mdp = self.explore()
+        np.savez_compressed(path, **mdp)
+        return mdp
+
+    def close(self):
+        self.qmi.close()
+
+
+def loadMDP(path):
+    """
+    Reads an MDP written by MDPExporter.export().
+
+    Returns
+    -------
+    dict
+        The arrays of the file; scalar parameters as Python values.
+    """
+    with np.load(path) as data:
+        return {k: (data[k].item() if data[k].ndim == 0 else data[k]) for k in data.files}
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Memoization layer for query engines.
+
+@author: Anonymous
+"""
+
+from collections import OrderedDict
+from .QMI import QMI, SituationHandle
+
+class CachedQMI(QMI):
+    """
+    Wraps a QMI and answers repeated queries from memory. Results are keyed by
+    (method, action, effect history, cross-run state), kept in a bounded cache
+    and evicted least recently used first.
+
+    Every handle of a CachedQMI stands for a handle of the wrapped engine, with
+    the same id. Advancing it only extends its history: the wrapped handle is
+    brought up to date on cache misses only, by advancing it through the effects
+    it lacks, or by setting it anew if the histories diverged or the cross-run
+    state changed since. Misses thus still use the engine's handles, and their 
+    progression if on.
+    """
+
+    def __init__(self,qmi,maxSize = 100000):
+        """
+        Parameters
+        ----------
+        qmi : QMI
+            The query engine to be wrapped.
+        maxSize : integer, optional
+            The maximum number of results kept. The default is 100000.
+        """
+        self.qmi = qmi
+        self.maxSize = maxSize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # The cross-run state last set; None for the one of the domain file.
+        self.transState = None
+        # By id: the handles of the wrapped engine, and the cross-run state 
+        # each was last brought up to date under.
+        self.handles = {}
+        self.handleTrans = {}
+
+    def __getattr__(self,name):
+        # Anything not cached is the wrapped engine's business.
+        if (name == "qmi"):
+            raise AttributeError(name)
+        return getattr(self.qmi,name)
+
+    def lookup(self,method,t,eH,query):
+        if isinstance(eH, SituationHandle):
+            history = tuple(eH.history)
+        else:
+            history = tuple([int(x) for x in eH.split(",") if x.strip()])
+        key = (method, t, history, self.transState)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        self.misses += 1
+        result = query(self.sync(eH) if isinstance(eH, SituationHandle) else eH)
+        self.cache[key] = result
+        if (len(self.cache) > self.maxSize):
+            self.cache.popitem(last = False)
+        return result
+
+    def sync(self,handle):
+        # The wrapped engine's handle of handle, at the same history.
+        inner = self.handles[handle.id]
+        done = len(inner.history)
+        if (self.handleTrans[handle.id] == self.transState) and (inner.history == handle.history[:done]):
+            for stochIdx in handle.history[done:]:
+                self.qmi.advance(inner, stochIdx)
+        else:
+            self.qmi.setHandle(inner, handle.history)
+            self.handleTrans[handle.id] = self.transState
+        return inner
+
+    def cacheStats(self):
+        """
+        Returns the hit and miss counters of the cache.
+
+        Returns
+        -------
+        dict
+            "hits", "misses" and "size" (the number of results currently kept).
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.cache)}
+
+    def clearCache(self):
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    #
+    # Q M I
+    #
+
+    def setFile(self,file):
+        """
+        [Refer to QMI function documentation.]
+        """
+        self.clearCache()
+        self.transState = None
+        self.qmi.setFile(file)
+
+    def newHandle(self):
+        """
+        [Refer to QMI function documentation.]
+        """
+        inner = self.qmi.newHandle()
+        self.handles[inner.id] = inner
+        self.handleTrans[inner.id] = self.transState
+        return SituationHandle(inner.id)
+
+    def advance(self,handle,stochIdx):
+        """
+        [Refer to QMI function documentation.]
+        """
+        handle.history.append(stochIdx)
+
+    def resetHandle(self,handle):
+        """
+        [Refer to QMI function documentation.]
+        """
+        handle.history = []
+
+    def setHandle(self,handle,history):
+        """
+        [Refer to QMI function documentation.]
+        """
+        handle.history = list(history)
+
+    def freeHandle(self,handle):
+        """
+        [Refer to QMI function documentation.]
+        """
+        self.qmi.freeHandle(self.handles.pop(handle.id))
+        del self.handleTrans[handle.id]
+
+    def possibleAt(self,t,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.lookup("possibleAt", t, eH, lambda h: self.qmi.possibleAt(t, h))
+
+    def getOutcomes(self,t,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        possStochActions, probs = self.lookup("getOutcomes", t, eH, lambda h: self.qmi.getOutcomes(t, h))
+        return list(possStochActions), list(probs)
+
+    def getProbs(self,t,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.getOutcomes(t, eH)
+
+    def reward(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.lookup("reward", None, eH, self.qmi.reward)
+
+    def getState(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return list(self.lookup("getState", None, eH, self.qmi.getState))
+
+    def getConState(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return list(self.lookup("getConState", None, eH, self.qmi.getConState))
+
+    def done(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.lookup("done", None, eH, self.qmi.done)
+
+    def achieved(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.lookup("achieved", None, eH, self.qmi.achieved)
+
+    def getTransState(self,eH):
+        """
+        [Refer to QueryEngine function documentation.]
+        """
+        return self.lookup("getTransState", None, eH, self.qmi.getTransState)
+
+    def stepInfo(self,eH,fields = ("TransState","Mask")):
+        """
+        [Refer to QMI function documentation.]
+        """
+        fields = tuple(fields)
+        info = self.lookup("stepInfo", fields, eH, lambda h: self.qmi.stepInfo(h, fields))
+        # Callers get their own lists, so that they cannot alter the cache.
+        return {k: (list(v) if isinstance(v, list) else v) for k, v in info.items()}
+
+    def feasibleMask(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return list(self.lookup("feasibleMask", None, eH, self.qmi.feasibleMask))
+
+    def setTransState(self,tS):
+        """
+        [Refer to QueryEngine function documentation.]
+        """
+        self.transState = tS
+        self.qmi.setTransState(tS)
+
+    def close(self):
+        self.clearCache()
+        self.qmi.close()
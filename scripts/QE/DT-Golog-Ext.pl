@@ -79,6 +79,25 @@ constructSit([TopList|List],do(Res,S)):-
 					constructSit(List,S).
 
 
+/* 
+resolveSituation/2
+From a list of action index numbers (see constructSituation/2) or a situation handle h(H) 
+(see newSitHandle/1) obtain the situation
+*/
+resolveSituation(h(H),S) :- !, sitHandleKey(H,K),nb_getval(K,S).
+resolveSituation(NumActionList,S) :- constructSituation(NumActionList,S).
+
+sitHandleKey(H,K) :- engineKey(dtgSitHandle,Prefix),atomic_list_concat([Prefix,'_',H],K).
+
+/*
+engineKey(+Name,-Key)
+The name of a global variable or flag of the module this file is loaded into, so
+that the query engines of a process, each in a module of its own, keep their
+counters and handles apart.
+*/
+engineKey(Name,Key) :- context_module(M),atomic_list_concat([M,'_',Name],Key).
+
+
 getProbs([],_,[]).
 getProbs([TopAction|StochActionList],S,[TopProb|Probs]) :- 
 		prob(TopAction,TopProb,S),
@@ -90,21 +109,26 @@ getRewardRL(+SNum,-R).
 +SNum: a list of indexes of stochastic actions, represneting the current situation.
 */
 getRewardRL_(SNum,R) :- 
+		resolveSituation(SNum,S),
+		getRewardRLS_(S,R).
+
+/*
+getRewardRLS_(+S,-R).
+As getRewardRL_/2 but for an already constructed situation S.
+*/
+getRewardRLS_(S,R) :- 
 		getRewardMode(episodic),
-		constructSituation(SNum,S),
 		reward(R,S).
 		
-getRewardRL_(SNum,R) :- 
+getRewardRLS_(S,R) :- 
 		getRewardMode(cummulative),
-		constructSituation(SNum,S),
 		rewardCum(R,S).
 		
-getRewardRL_(SNum,R) :- 
+getRewardRLS_(S,R) :- 
 		getRewardMode(instant),
-		constructSituation(SNum,S),
 		rewardInst(R,S).
 		
-getRewardRL_(SNum,R) :- 
+getRewardRLS_(S,R) :- 
 		\+ (getRewardMode(instant);getRewardMode(cummulative);getRewardMode(episodic)),
 		write("ERROR: No reward mode declared.").
 
@@ -154,7 +178,7 @@ fromItemsToIndex([TopItem|ItemList],Pool,[TopIndex|IndexList]):-
 % possibleAgentActionsNum(+SNum,ActionList)
 % + SNum: a list of indexes of Stochastic Actions from the first to the last
 % - Res: A list of indexes of agent Actions.
-possibleAgentActionsNum(SNum,Res) :- constructSituation(SNum,S),
+possibleAgentActionsNum(SNum,Res) :- resolveSituation(SNum,S),
 								possibleAgentActions(S,Res).
 
 
@@ -169,6 +193,13 @@ possibleAgentActions(S,Res) :-
 								fromItemsToIndex(Bag,Pool,Res).
 
 
+% truthBit(+Goal,-Bit)
+% + Goal: a goal to be proven
+% - Bit: 1 if Goal holds, 0 otherwise
+truthBit(Goal,1) :- call(Goal),!.
+truthBit(_,0).
+
+
 % noActionPossibleAgentActions(+Situation)
 % + Situation: a Golog situation
 noActionPossible(S) :- \+ (setof(X, poss(X,S), Bag),length(Bag,X),X > 0).
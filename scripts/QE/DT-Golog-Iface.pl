@@ -2,6 +2,7 @@
 :-style_check(-singleton).
 :-consult("DT-Golog.pl").
 :-consult("DT-Golog-Ext.pl").
+:-use_module(library(prolog_wrap)).
 :- multifile getRewardMode/1.
 :- multifile getRewardModeDTG/1.
 :- multifile penalizeDeadlock/1.
@@ -19,13 +20,248 @@ getInfeasiblePenalty(-100).
 penalizeDeadlock(0).
 deadlockPenalty(0).
 
+:- dynamic(progressionMode/1).
+:- dynamic(progTemplate/1).
+:- dynamic(progFluent/2).
+
+/*
+S I T U A T I O N   H A N D L E S
+
+Wherever a predicate below takes a list of stochastic action indexes (SNum), a 
+handle h(H) may be given instead. A handle names a situation that is kept on the 
+Prolog side and grows by one do/2 per advanceSitHandle/2, so that the situation 
+need not be reconstructed from the full list on every query.
+*/
+
+/*
+newSitHandle(-H)
+Creates a new handle for the initial situation s0.
+-H: an integer identifying the handle; to be used as h(H).
+*/
+newSitHandle(H) :- engineKey(sitHandleCounter,C),
+						flag(C,H,H+1),
+						sitHandleKey(H,K),
+						nb_setval(K,s0).
+
+/*
+advanceSitHandle(+H,+StochNum)
+Extends the situation of handle H by the stochastic action with index StochNum.
+*/
+advanceSitHandle(H,StochNum) :- sitHandleKey(H,K),
+						nb_getval(K,S),
+						stochasticActionList(Actions),
+						nth0(StochNum,Actions,A),
+						progress(do(A,S),S1),
+						releaseSit(S),
+						nb_setval(K,S1).
+
+/*
+resetSitHandle(+H)
+Brings handle H back to the initial situation s0.
+*/
+resetSitHandle(H) :- sitHandleKey(H,K),
+						nb_getval(K,S),
+						releaseSit(S),
+						nb_setval(K,s0).
+
+/*
+setSitHandle(+H,+SNum)
+Brings handle H to the situation of the list of stochastic action indexes SNum, 
+as if it were reset and advanced by each of them in turn.
+*/
+setSitHandle(H,SNum) :- resetSitHandle(H),
+						forall(member(StochNum,SNum), advanceSitHandle(H,StochNum)).
+
+/*
+freeSitHandle(+H)
+Releases handle H. It may not be used afterwards.
+*/
+freeSitHandle(H) :- sitHandleKey(H,K),
+						(nb_current(K,S) -> (releaseSit(S), nb_delete(K)) ; true).
+
+
+/*
+P R O G R E S S I O N
+
+In progression mode a handle does not keep the do/2 chain of its situation. Each 
+time it is advanced, the state fluents are evaluated once in the new situation, 
+their values are recorded as progFluent(P,Fluent) facts and the situation is 
+replaced by the constant prog(P). The state fluent predicates are wrapped so that 
+at prog(P) they read the recorded facts rather than regress.
+
+State fluents (stateFluent/1) are those named in fluentList/1, ccStateShapeInfo/1, 
+transStateStructure/1 and restoreSitArg/3, the situation being their last 
+argument. Any other predicate follows the situation back as written, which it 
+cannot do from prog(P): those with a clause for s0 or do(_,_) as their last 
+argument (successor state axioms of fluents that are none of the above) are 
+wrapped to raise progression_unsupported(Name/Arity) there, rather than fail and 
+have actions reported infeasible or goals unachieved. Likewise, reward modes that 
+walk back the whole history (cummulative, episodic) are not supported.
+Handles made before the mode is enabled, as well as lists of indexes, still 
+produce do/2 chains.
+*/
+
+/*
+enableProgression
+Turns progression mode on for situations reached through handles.
+*/
+enableProgression :- retractall(progTemplate(_)),
+						findall(N/A,(stateFluent(F),functor(F,N,A)),NAs),
+						sort(NAs,Sorted),
+						forall(member(N/A,Sorted),(functor(T,N,A),assertz(progTemplate(T)))),
+						forall(progTemplate(T),wrapProgFluent(T)),
+						findall(N/A,historyPredicate(N/A),Guarded),
+						sort(Guarded,GuardedSorted),
+						forall(member(N/A,GuardedSorted),guardHistoryPredicate(N,A)),
+						retractall(progressionMode(_)),
+						assertz(progressionMode(on)).
+
+stateFluent(F) :- current_predicate(fluentList/1),
+						fluentList(Fs),member(F,Fs).
+stateFluent(F) :- current_predicate(ccStateShapeInfo/1),
+						getStateShapeInfo(Fs,_,_),member(F,Fs).
+stateFluent(F) :- current_predicate(transStateStructure/1),
+						transStateStructure(Fs),member(F,Fs).
+stateFluent(F) :- current_predicate(restoreSitArg/3),
+						restoreSitArg(F,_,_).
+
+/* historyPredicate(-N/A): a predicate of the domain, not a state fluent, with a clause for s0 or do(_,_). */
+historyPredicate(N/A) :- current_predicate(N/A), A > 0,
+						functor(H,N,A),
+						\+ predicate_property(H,imported_from(_)),
+						\+ predicate_property(H,foreign),
+						\+ (progTemplate(T),sitGoal(T,_,G),functor(G,N,A)),
+						arg(A,H,Sit),
+						once((clause(H,_),nonvar(Sit),(Sit == s0 ; Sit = do(_,_)))).
+
+guardHistoryPredicate(N,A) :- functor(Head,N,A),
+						arg(A,Head,S),
+						wrap_predicate(Head,progressionGuard,Wrapped,
+							((nonvar(S),S = prog(_)) -> throw(error(progression_unsupported(N/A),_)) ; Wrapped)).
+
+/*
+progressionUnsupported(-Modes,-Actions)
+What keeps progression from serving the domain, checked once it is enabled: Modes 
+lists the declared reward modes other than instant, Actions the stochastic actions 
+possible at s0 after which the progressed situation cannot be queried as a step 
+needs: its reward, whether the goal is achieved, whether the episode is done and 
+which actions are possible (e.g. because they read fluents that are not state 
+fluents). Both are empty if progression is fine as far as the first step goes; 
+later steps still raise progression_unsupported should they need such fluents.
+*/
+progressionUnsupported(Modes,Actions) :- findall(M,(getRewardMode(M),M \== instant),Modes),
+						stochasticActionList(As),
+						findall(A,(member(A,As),poss(A,s0),
+							progress(do(A,s0),S),
+							(catch(progressedStep(S),_,fail) -> Ok = true ; Ok = false),
+							releaseSit(S),
+							Ok == false),Actions).
+
+progressedStep(S) :- getRewardRLS(S,R),number(R),
+						ignore(goalAchieved(S)),
+						ignore(noActionPossible(S)),
+						feasibleMaskS(S,_).
+
+/* sitGoal(+F,+S,-G): the call of fluent F at situation S. */
+sitGoal(F,S,G) :- F =.. L, append(L,[S],L1), G =.. L1.
+
+wrapProgFluent(T) :- sitGoal(T,S,Head),
+						functor(Head,N,A),
+						(current_predicate(N/A) ->
+							wrap_predicate(Head,progression,Wrapped,
+								((nonvar(S),S = prog(P)) -> progFluent(P,T) ; Wrapped))
+						; true).
+
+/*
+progress(+S,-S1)
+S1 is the situation to keep for S: S itself unless progression is on.
+*/
+progress(S,prog(P)) :- progressionMode(on),!,
+						engineKey(progSitCounter,C),
+						flag(C,P,P+1),
+						forall((progTemplate(T),sitGoal(T,S,G),call(G)),
+							assertz(progFluent(P,T))).
+progress(S,S).
+
+/* releaseSit(+S): drop the facts recorded for S, if any. */
+releaseSit(prog(P)) :- !, retractall(progFluent(P,_)).
+releaseSit(_).
+
+
+/*
+T A B L I N G
+
+enableTabling(+MaxBytes)
+Declares the state fluents (see progression above), the targets of restoreSitArg/3 
+and goalAchieved/1 as tabled, so that sub-situations are derived only once across 
+the calls of a query. 
+Since fluents at s0 may depend on init/1, the tables are to be abolished with 
+resetTables/0 whenever the latter changes.
+MaxBytes is a hard cap, not a cache size: SWI-Prolog evicts nothing, but raises a 
+resource error once the tables fill the table space. Queries are therefore to be 
+run through tabledCall/1. The table space (the table_space flag) is shared by all 
+the modules of the process, so it is only ever raised here, to the largest 
+MaxBytes asked for.
+*/
+enableTabling(MaxBytes) :- raiseTableSpace(MaxBytes),
+						findall(N/A,(tablingTarget(G),functor(G,N,A)),NAs),
+						sort(NAs,Sorted),
+						forall((member(N/A,Sorted),current_predicate(N/A)),table(N/A)).
+
+tablingTarget(G) :- stateFluent(F),sitGoal(F,_,G).
+tablingTarget(G) :- current_predicate(restoreSitArg/3),restoreSitArg(_,_,G).
+tablingTarget(goalAchieved(_)).
+
+raiseTableSpace(MaxBytes) :- current_prolog_flag(table_space,Current),
+						Space is max(Current,MaxBytes),
+						set_prolog_flag(table_space,Space).
+
+/* resetTables: abolishes the tables of this module only, not those of other engines. */
+resetTables :- context_module(M),abolish_module_tables(M).
+
+/*
+tabledCall(+G)
+Calls G. Should the tables fill the table space meanwhile, abolishes them and calls 
+G again from scratch; a second overflow, as well as any other resource error (e.g. 
+of the stacks), is raised. G is thus to be free of side effects a second call would 
+not repeat alike.
+*/
+tabledCall(G) :- catch(G,error(resource_error(table_space),_),(resetTables,G)).
+
+
+/*
+E N G I N E   R E U S E
+
+A closed engine leaves its module, with everything loaded into it, to the next 
+engine of the same domain in the process, instead of every engine loading copies 
+of its own that are never unloaded.
+
+rememberInit
+Records the initial state (init/1) as the domain asserts it, once loaded.
+
+releaseEngine
+Brings the module back to the state it was loaded in: the recorded initial state, 
+no progressed situations and no tables.
+*/
+:- dynamic(loadedInit/1).
+
+rememberInit :- findall(I,(current_predicate(init/1),init(I)),Is),
+						retractall(loadedInit(_)),
+						assertz(loadedInit(Is)).
+
+releaseEngine :- retractall(progFluent(_,_)),
+						(current_predicate(init/1) -> retractall(init(_)) ; true),
+						(loadedInit(Is) -> forall(member(I,Is),assertz(init(I))) ; true),
+						resetTables.
+
+
 /* 
 possibleAt(+SituationNum,+Action)
 +SituationNum: a list of indexes of Stochastic Actions from the first to the last
 +Action: an index to the action in question.
 */
 possibleAt(SituationNum,ANum) :- 
-						constructSituation(SituationNum,S),
+						resolveSituation(SituationNum,S),
 						agentActionList(Pool),
 						nth0(ANum,Pool,A),
 						poss(A,S).
@@ -42,7 +278,7 @@ getActionOutcomes(+AgentActionNum,+SituationNum,-StochActionsListNum,-ProbList).
 getActionOutcomes(AgentActionNum, SituationNum, StochActionsListNum, ProbList):-
 	agentActionList(AgentA),
 	stochasticActionList(StochA),
-	constructSituation(SituationNum,S),
+	resolveSituation(SituationNum,S),
 	nth0(AgentActionNum,AgentA,AgentActionTerm),
 	nondetActions(AgentActionTerm,S,StochActionsListTerm),
 	getProbs(StochActionsListTerm,S,ProbList),
@@ -56,12 +292,18 @@ getRewardRL(+SNum,-R).
 or cummulative (the reward of all actions since s0) depending on congiguration. See top of the file.
 A deadlock penaly may also be defined if penalizeDeadlock is set to 1 -- this feature is not used anymore.
 */
-getRewardRL(SNum,R) :- penalizeDeadlock(1),
-						constructSituation(SNum,S),
+getRewardRL(SNum,R) :- resolveSituation(SNum,S),
+						getRewardRLS(S,R).
+
+/*
+getRewardRLS(+S,-R).
+As getRewardRL/2 but for an already constructed situation S.
+*/
+getRewardRLS(S,R) :- penalizeDeadlock(1),
 						deadlock(S), 
 						deadlockPenalty(R).
-getRewardRL(SNum,R) :- \+ (penalizeDeadlock(1), constructSituation(SNum,S), deadlock(S)),
-						getRewardRL_(SNum,R).
+getRewardRLS(S,R) :- \+ (penalizeDeadlock(1), deadlock(S)),
+						getRewardRLS_(S,R).
 
 /*
 getState(+SNum,-Res)
@@ -69,7 +311,7 @@ From an indexed situation S returns a binary list marking the fluents that are t
 +SNum: a list of indexes of stochastic actions, representing the current situation.
 -Res: a binary list representing the state of each of the fluents.
 */
-getState(SNum,Res) :- constructSituation(SNum,S),
+getState(SNum,Res) :- resolveSituation(SNum,S),
 					getStateG(S,Res).
 
 
@@ -79,27 +321,54 @@ From an indexed situation S returns a list with the value of continuous fluents.
 +SNum: a list of indexes of stochastic actions, representing the current situation.
 -Res: a list representing the value of each of the continuous fluents.
 */
-getCCState(SNum,Res) :- constructSituation(SNum,S),
-						getStateShapeInfo(Fs,_,_),
+getCCState(SNum,Res) :- resolveSituation(SNum,S),
+						getCCStateS(S,Res).
+
+/*
+getCCStateS(+S,-Res)
+As getCCState/2 but for an already constructed situation S. 
+Domains without a ccStateShapeInfo/1 declaration (discrete ones) yield an empty list.
+*/
+getCCStateS(_,[]) :- \+ current_predicate(ccStateShapeInfo/1),!.
+getCCStateS(S,Res) :- getStateShapeInfo(Fs,_,_),
 						trueCCFluents(Fs,S,ResF),
 						extractValues(ResF,Res).
 
 
+/*
+feasibleMask(+SNum,-Mask)
+Marks which agent actions are possible in a situation, in the order of agentActionList/1.
++SNum: a list of indexes of stochastic actions, representing the current situation.
+-Mask: a binary list with 1 for every agent action that is possible and 0 otherwise.
+*/
+feasibleMask(SNum,Mask) :- resolveSituation(SNum,S),
+						feasibleMaskS(S,Mask).
+
+feasibleMaskS(S,Mask) :- agentActionList(Pool),
+						findall(B,(member(A,Pool),truthBit(poss(A,S),B)),Mask).
+
+
 /*
 getTransState(+SNum,-Res)
 Get the state of the trascendent fluents.
 +SNum: a list of indexes of stochastic actions, representing the current situation.
 -Res: a list of transcendent predicates unified with the values at the given situation.
 */
+getTransState(SNum,Res) :- resolveSituation(SNum,S),
+						getTransStateS(S,Res).
+
+/*
+getTransStateS(+S,-Res)
+As getTransState/2 but for an already constructed situation S.
+*/
 /* If inintial state has been ommited, just return an empty list */
-getTransState(_,[]) :- \+ current_predicate(transStateStructure/1), 
+getTransStateS(_,[]) :- \+ current_predicate(transStateStructure/1), 
                         \+ current_predicate(init/1),!.
 /* Default (no trans-states defined) is to return the hardcoded initial state */
-getTransState(_,Res) :- \+ current_predicate(transStateStructure/1), 
+getTransStateS(_,Res) :- \+ current_predicate(transStateStructure/1), 
                             init(Res),!.
 /* If both are defined work as follows */
-getTransState(SNum,Res) :- current_predicate(transStateStructure/1), 
-                        constructSituation(SNum,S),
+getTransStateS(S,Res) :- current_predicate(transStateStructure/1), 
 						transStateStructure(Fs),
 						trueCCFluents(Fs,S,Res),!.
 
@@ -118,9 +387,142 @@ done(+SNum)
 Decides if a situation signifies the end of an episode (due to deadlock or root goal completion).
 +SNum: a list of indexes of stochastic actions, representing the current situation.
 */
-done(SNum) :- constructSituation(SNum,S),noActionPossible(S),!.
+done(SNum) :- resolveSituation(SNum,S),noActionPossible(S),!.
 /* done(SNum) :- constructSituation(SNum,S),episodeDone(S).*/
 
+/*
+stepInfo(+SNum,-R,-State,-CCState,-Done,-Achieved,-TransState,-Mask)
+Everything the environment needs to know after a step, computed on a single constructed situation.
++SNum: a list of indexes of stochastic actions, representing the current situation.
+-R: the reward as in getRewardRL/2. The empty situation (no action performed yet) yields 0.
+-State: a binary list as in getState/2.
+-CCState: a list of continuous fluent values as in getCCState/2 (empty for discrete domains).
+-Done: 1 if the situation signifies the end of an episode as in done/1, 0 otherwise.
+-Achieved: 1 if the root goal is satisfied as in achieved/1, 0 otherwise.
+-TransState: the transcendent predicates as in getTransState/2.
+-Mask: a binary list marking the agent actions possible in the situation, as in feasibleMask/2.
+*/
+stepInfo(SNum,R,State,CCState,Done,Achieved,TransState,Mask) :-
+						stepInfo(SNum,[transState,mask],R,State,CCState,Done,Achieved,TransState,Mask).
+
+/*
+stepInfo(+SNum,+Fields,-R,-State,-CCState,-Done,-Achieved,-TransState,-Mask)
+As stepInfo/8, but TransState and Mask are only computed if named in the list 
+Fields (transState, mask), and are none otherwise: the mask alone checks poss/2 
+for every agent action.
+*/
+stepInfo(SNum,Fields,R,State,CCState,Done,Achieved,TransState,Mask) :-
+						resolveSituation(SNum,S),
+						stepReward(S,R),
+						getStateG(S,State),
+						getCCStateS(S,CCState),
+						truthBit(noActionPossible(S),Done),
+						truthBit(goalAchieved(S),Achieved),
+						optionalField(transState,Fields,getTransStateS(S,TransState),TransState),
+						optionalField(mask,Fields,feasibleMaskS(S,Mask),Mask).
+
+optionalField(Name,Fields,Goal,_) :- memberchk(Name,Fields),!,call(Goal).
+optionalField(_,_,_,none).
+
+stepReward(s0,0) :- !.
+stepReward(S,R) :- getRewardRLS(S,R).
+
+
+/*
+R O L L O U T S
+
+Whole episodes simulated within Prolog, with the semantics of the Python 
+environment: an action already attempted in the run, or not possible, earns the 
+infeasible action penalty and ends the episode; achieving the root goal concludes 
+the run and passes its trans state (as init/1) to the next; the episode ends when 
+no action is possible or all runs are concluded.
+*/
+
+/*
+rolloutEpisodes(+N,+Policy,+Seed,+Forgive,-Rewards)
+Simulates N episodes, each starting from s0 under the init/1 currently asserted, 
+which is restored when done (left undefined if the domain has none).
++N: the number of episodes.
++Policy: a list of agent action indexes attempted in order, the last one repeatedly 
+if the episode outlasts the list; [] for actions picked uniformly at random.
++Seed: the seed of the random number generator, or none to leave it as it is.
++Forgive: 1 to leave infeasible action penalties out of the returns, 0 otherwise.
+-Rewards: the list of the N episode returns.
+*/
+rolloutEpisodes(N,Policy,Seed,Forgive,Rewards) :-
+						(Seed == none -> true ; set_random(seed(Seed))),
+						(current_predicate(init/1) -> Defined = true ; Defined = false),
+						findall(I,(Defined == true,init(I)),Inits),
+						(Inits = [Init0|_] -> true ; getTransStateS(s0,Init0)),
+						findall(R,(between(1,N,_),rolloutEpisode(Policy,Init0,Forgive,R)),Rewards),
+						restoreInit(Defined,Inits).
+
+rolloutEpisode(Policy,Init0,Forgive,Return) :-
+						setInitState(Init0),
+						getNumRuns(Runs),
+						once(getInfeasiblePenalty(Penalty)),
+						(Policy == [] -> Actions = random ; Actions = Policy),
+						rolloutSteps(Actions,none,0,Runs,[],s0,Forgive,Penalty,0,Return).
+
+/* rolloutSteps(+Policy,+Last,+Run,+Runs,+Tried,+S,+Forgive,+Penalty,+Acc,-Return) */
+rolloutSteps(_,_,Run,Runs,_,_,_,_,Acc,Acc) :- Run >= Runs,!.
+rolloutSteps(_,_,_,_,_,S,_,_,Acc,Acc) :- noActionPossible(S),!.
+rolloutSteps(Policy,Last,Run,Runs,Tried,S,Forgive,Penalty,Acc,Return) :-
+						rolloutAction(Policy,Last,ANum,Rest),
+						agentActionList(Pool),
+						nth0(ANum,Pool,A),
+						(   \+ memberchk(ANum,Tried), poss(A,S)
+						->  nondetActions(A,S,Outcomes),
+							getProbs(Outcomes,S,Probs),
+							sampleOutcome(Outcomes,Probs,O),
+							S1 = do(O,S),
+							getRewardRLS(S1,R),
+							Acc1 is Acc + R,
+							(   goalAchieved(S1)
+							->  getTransStateS(S1,TransState),
+								setInitState(TransState),
+								Run1 is Run + 1,
+								rolloutSteps(Rest,ANum,Run1,Runs,[],s0,Forgive,Penalty,Acc1,Return)
+							;   rolloutSteps(Rest,ANum,Run,Runs,[ANum|Tried],S1,Forgive,Penalty,Acc1,Return)
+							)
+						;   infeasibleReward(Forgive,Penalty,C),
+							Return is Acc + C
+						).
+
+/* The next action: a random one, the head of the list, or the last one again. */
+rolloutAction(random,_,ANum,random) :- !,
+						actionSize(L),
+						ANum is random(L).
+rolloutAction([],Last,Last,[]) :- !.
+rolloutAction([ANum|Rest],_,ANum,Rest).
+
+/* Picks one of the outcomes according to their probabilities. */
+sampleOutcome(Outcomes,Probs,O) :- sum_list(Probs,Total),
+						random(U),
+						Point is U*Total,
+						pickOutcome(Outcomes,Probs,Point,O).
+
+pickOutcome([O],_,_,O) :- !.
+pickOutcome([O|_],[P|_],Point,O) :- Point < P,!.
+pickOutcome([_|Os],[P|Ps],Point,O) :- Point1 is Point - P,
+						pickOutcome(Os,Ps,Point1,O).
+
+/* What an infeasible attempt adds to the return: nothing if forgiven, the penalty otherwise. */
+infeasibleReward(1,_,0) :- !.
+infeasibleReward(_,Penalty,Penalty).
+
+/* Puts init/1 back as it was: the given clauses, or no predicate at all if it was not defined. */
+restoreInit(Defined,Inits) :- retractall(init(_)),
+						forall(member(I,Inits),assertz(init(I))),
+						(Defined == false -> abolish(init/1) ; true),
+						resetTables.
+
+/* Asserts the trans state as the initial state of the next run, as setTransState does. */
+setInitState(TransState) :- retractall(init(_)),
+						assertz(init(TransState)),
+						resetTables.
+
+
 /*
 
 H E L P E R S 
@@ -158,4 +560,4 @@ achieved(+SNum)
 Holds if in the situation SNum the root goal is satisfied.
 +SNum: a list of indexes of stochastic actions, representing the current situation.
 */
-achieved(SNum) :- constructSituation(SNum,S),goalAchieved(S).
+achieved(SNum) :- resolveSituation(SNum,S),goalAchieved(S).
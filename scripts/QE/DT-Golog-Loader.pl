@@ -0,0 +1,62 @@
+:- module(dtgLoader, [loadEngineFile/2]).
+
+/*
+L O A D I N G   I N T O   E N G I N E   M O D U L E S
+
+Every query engine keeps the interface, DT-Golog and its domain in a module of
+its own (dtgEngine<N>). SWI-Prolog registers a non-module file with the module
+that loads it first, and refuses to load it into another one. So the first engine
+to load a file consults it as usual (through its .qlf file, if compiled), while
+the next ones load a copy of its source, registered under a name of their own
+(<path>@<module>). Consults within files loaded into an engine module are loaded
+the same way, relative to the file that makes them.
+*/
+
+:- dynamic(engineModule/1).
+:- dynamic(loadedAs/3).
+
+/*
+loadEngineFile(+M,+File)
+Loads File, and the files it consults, into the engine module M. Loading a file
+into a module again reloads it the way it was first loaded there.
+*/
+loadEngineFile(M,File) :- (engineModule(M) -> true ; assertz(engineModule(M))),
+						textAtom(File,F),
+						absolute_file_name(F,Path,[file_type(prolog),access(read)]),
+						loadInto(M,Path).
+
+/* loadedAs(?Path,?M,?Id): Path is loaded into M under the name Id. */
+loadInto(M,Path) :- loadedAs(Path,M,Id),!,
+						loadAs(M,Path,Id).
+loadInto(M,Path) :- (loadedAs(Path,_,_) ; source_file(Path)),!,
+						atomic_list_concat([Path,'@',M],Id),
+						assertz(loadedAs(Path,M,Id)),
+						loadAs(M,Path,Id).
+loadInto(M,Path) :- assertz(loadedAs(Path,M,Path)),
+						loadAs(M,Path,Path).
+
+loadAs(M,Path,Path) :- !, M:consult(Path).
+loadAs(M,Path,Id) :- setup_call_cleanup(open(Path,read,S),
+							M:load_files(Id,[stream(S)]),
+							close(S)).
+
+/* loadHere(+Paths): the consult of Paths by a file being loaded into an engine module. */
+loadHere(Paths) :- prolog_load_context(module,M),
+						forall(member(P,Paths),loadInto(M,P)).
+
+:- multifile(user:term_expansion/2).
+:- dynamic(user:term_expansion/2).
+
+user:term_expansion((:- Directive),(:- dtgLoader:loadHere(Paths))) :-
+						consultDirective(Directive,Files),
+						prolog_load_context(module,M),
+						engineModule(M),
+						prolog_load_context(directory,Dir),
+						findall(P,(member(F0,Files),textAtom(F0,F),
+							absolute_file_name(F,P,[relative_to(Dir),file_type(prolog),access(read)])),Paths).
+
+consultDirective(consult(F),Fs) :- (is_list(F) -> Fs = F ; Fs = [F]).
+consultDirective([F|Fs],[F|Fs]).
+
+textAtom(T,A) :- string(T),!,atom_string(A,T).
+textAtom(A,A).
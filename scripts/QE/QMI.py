@@ -5,6 +5,25 @@ Created on Tue Jan 31 11:44:06 2023
 @author: Anonymous
 """
 
+class SituationHandle:
+    """
+    An opaque reference to a situation kept by the query engine. Obtained through 
+    QMI.newHandle() and extended by one effect at a time through QMI.advance(). 
+    Wherever a QMI method takes an effect history eH, a handle can be given instead.
+    """
+    def __init__(self,hid = None):
+        # The engine-side identifier of the handle.
+        self.id = hid
+        # The effects (nature actions) that lead to the situation, first to last.
+        self.history = []
+
+    def eHString(self):
+        """
+        Returns the history of the handle as an eH string of the form "i_1, i_2, ...".
+        """
+        return ",".join([str(x) for x in self.history])
+
+
 class QMI:
     def __init__(self,file):
         """ Something """
@@ -160,3 +179,112 @@ class QMI:
             True if the episode is done.
         """
         pass
+    def stepInfo(self,eH,fields = ("TransState","Mask")) -> dict:
+        """
+        Returns, in a single query, everything the environment needs to know about history eH after a step.
+
+        Parameters
+        ----------
+         eH : String
+             A string of the form "i_1, i_2, ...", each i being an integer representing an effect (nature action) in the goal model (after multi-run correction).
+         fields : tuple of Strings, optional
+             Which of the costlier entries, "TransState" and "Mask", to compute as well. The default is both.
+
+        Returns
+        -------
+        dict
+            "Reward" (float): as in reward(eH), 0 for the empty history.
+            "State" (list[bool]): as in getState(eH).
+            "CCState" (list[float]): as in getConState(eH), empty for discrete domains.
+            "Done" (bool): as in done(eH).
+            "Achieved" (bool): True if the root goal is achieved at eH.
+            "TransState" (String): the cross-run state at eH, in the form accepted by setTransState; only if in fields.
+            "Mask" (list[bool]): as in feasibleMask(eH); only if in fields.
+        """
+        pass
+    def feasibleMask(self,eH) -> list[bool]:
+        """
+        Checks, in a single query, which agent actions are possible after effect history eH.
+
+        Parameters
+        ----------
+         eH : String
+             A string of the form "i_1, i_2, ...", each i being an integer representing an effect (nature action) in the goal model (after multi-run correction).
+
+        Returns
+        -------
+        list[bool]
+            One value per agent action, in the order of the domain spec's "agentActionList(...).", True if possibleAt would hold for it.
+        """
+        pass
+    def newHandle(self) -> SituationHandle:
+        """
+        Creates a handle to the initial situation (empty effect history).
+
+        Returns
+        -------
+        SituationHandle
+            The new handle.
+        """
+        pass
+    def advance(self,handle,stochIdx):
+        """
+        Extends the situation of a handle by one effect (nature action).
+
+        Parameters
+        ----------
+        handle : SituationHandle
+            The handle to extend, as returned by newHandle().
+        stochIdx : integer
+            The effect (nature action) that has happened (after multi-run correction).
+
+        Returns
+        -------
+        None.
+        """
+        pass
+    def resetHandle(self,handle):
+        """
+        Brings a handle back to the initial situation (empty effect history).
+
+        Parameters
+        ----------
+        handle : SituationHandle
+            The handle to reset.
+
+        Returns
+        -------
+        None.
+        """
+        pass
+    def setHandle(self,handle,history):
+        """
+        Brings a handle to the situation of an effect history, in one go.
+
+        Parameters
+        ----------
+        handle : SituationHandle
+            The handle to set.
+        history : list of integers
+            The effects (nature actions) leading to the situation, first to last.
+
+        Returns
+        -------
+        None.
+        """
+        pass
+
+    def freeHandle(self,handle):
+        """
+        Releases a handle. It may not be used afterwards.
+
+        Parameters
+        ----------
+        handle : SituationHandle
+            The handle to release.
+
+        Returns
+        -------
+        None.
+        """
+        pass
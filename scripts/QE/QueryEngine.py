@@ -6,32 +6,312 @@ Created on Tue Jan 31 11:39:07 2023
 """
 
 from pyswip import Prolog
-from .QMI import QMI
+from .QMI import QMI, SituationHandle
+import glob
+import hashlib
+import itertools
+import os
+import time
+
+# The interface between the query engine and DT-Golog.
+IFACE_FILE = "./scripts/QE/DT-Golog-Iface.pl"
+
+# Loads non-module files into the module of an engine (see consult).
+LOADER_FILE = "./scripts/QE/DT-Golog-Loader.pl"
+
+# Numbers the Prolog modules of the engines of the process.
+moduleIds = itertools.count()
+
+# The modules of closed engines, by what is loaded into them (see moduleKey), 
+# for new engines to take over.
+freeModules = {}
 
 class QueryEngine(QMI):
     
     
-    def __init__(self,file):
+    def __init__(self,file,progression = False,tabling = False,tableSpace = 256*1024**2,qlfCache = False):
+        """
+        Loads the interface and the domain specification into a Prolog module of 
+        the engine's own, so that several engines, even of different domains, can 
+        coexist in one process. The module of a closed engine with the same domain 
+        and options, if any, is taken over instead, as it was loaded (see close).
+
+        Parameters
+        ----------
+        file : String
+            The path of the domain specification.
+        progression : bool, optional
+            If True, situations reached through handles are progressed: the state 
+            fluents are evaluated once after every advance and read from there on, 
+            instead of being regressed over the whole history on every query. 
+            Requires every fluent the domain uses to be listed in fluentList, 
+            ccStateShapeInfo, transStateStructure or restoreSitArg, and the instant 
+            reward mode; a ValueError is raised on loading if the reward cannot be 
+            evaluated at progressed situations. The default is False.
+        tabling : bool, optional
+            If True, the state fluents, the targets of restoreSitArg and goalAchieved 
+            are tabled, so that a sub-situation is derived only once per query. 
+            The tables are abolished whenever the cross-run state is set (i.e. on 
+            every environment reset). The default is False.
+        tableSpace : integer, optional
+            A hard cap in bytes on the space of the tables when tabling: nothing is 
+            evicted, but should a query fill it, the tables of the engine are 
+            abolished and the query is run again. The table space is shared by 
+            all the engines of the process, which get the largest one asked for. 
+            The default is 256MB.
+        qlfCache : bool, optional
+            If True, the interface and the domain are compiled to SWI-Prolog quick 
+            load files (.qlf, next to their sources) the first time they are loaded, 
+            and later loads read the compiled files instead. A compiled file is reused 
+            only while the hash of the content of its source is the one it was 
+            compiled from. Only the first engine of a process to load a file reads 
+            its compiled file, and an engine that takes over the module of a closed 
+            one loads nothing at all; others, built while the first is open, load 
+            a copy of its source. The default is False.
+        """
         self.prolog = Prolog()
-        # First load the interface file
-        self.prolog.consult("./scripts/QE/DT-Golog-Iface.pl")
-        # Then load the domain file
-        self.prolog.consult(file)
+        self.progression = progression
+        self.tabling = tabling
+        self.tableSpace = tableSpace
+        # Whether queries go through tabledCall (once the tables are declared).
+        self.tableGuard = False
+        self.qlfCache = qlfCache
+        # Seconds spent loading the interface and the domain (see getLoadTime).
+        self.loadTime = 0
+        # Seconds spent in queries other than loading (see getQueryTime).
+        self.queryTime = 0
+        # All predicates of the engine live in this module.
+        free = freeModules.get(self.moduleKey(file))
+        if free:
+            self.module = free.pop()
+            self.takeOverModule(file)
+        else:
+            self.module = "dtgEngine" + str(next(moduleIds))
+            self.loadDomain(file)
         
     def setFile(self,file):
         """
         [Refer to QMI function documentation.]
         """
         # When setting a new file, we need to reload both files
-        self.prolog.consult("./scripts/QE/DT-Golog-Iface.pl")
-        self.prolog.consult(file)
+        self.loadDomain(file)
+
+    def loadDomain(self,file):
+        st = time.perf_counter()
+        queryTime = self.queryTime
+        list(self.prolog.query("use_module('" + LOADER_FILE + "')"))
+        if (self.qlfCache):
+            sources = self.sourceFiles(file)
+            self.dropStaleQlf(sources)
+            # Have every consult, including the nested ones, go through .qlf 
+            # files while loading, and only then: the flag is process-wide.
+            qcompile = self.query("current_prolog_flag(qcompile, Q)")[0]['Q']
+            self.query("set_prolog_flag(qcompile, auto)")
+        try:
+            # First load the interface file
+            self.consult(IFACE_FILE)
+            # Then load the domain file
+            self.consult(file)
+        finally:
+            if (self.qlfCache):
+                self.query("set_prolog_flag(qcompile, " + str(qcompile) + ")")
+        if (self.qlfCache):
+            self.recordQlf(sources)
+        if (self.progression):
+            self.query("enableProgression")
+            self.checkProgression(file)
+        if (self.tabling):
+            self.query("enableTabling(" + str(self.tableSpace) + ")")
+            self.tableGuard = True
+        self.query("rememberInit")
+        self.key = self.moduleKey(file)
+        self.loadTime = time.perf_counter() - st
+        # Loading is accounted for by loadTime.
+        self.queryTime = queryTime
+
+    def checkProgression(self,file):
+        # Fluents that are not progressed raise at progressed situations (see
+        # progression in DT-Golog-Iface.pl): have the domain say so upfront,
+        # as far as the first step goes, rather than on some later query.
+        res = self.query("progressionUnsupported(Modes,Actions)")[0]
+        modes = [str(m) for m in res['Modes']]
+        actions = [str(a) for a in res['Actions']]
+        if modes:
+            raise ValueError("Progression needs the instant reward mode, but {} declares {}".format(file, ", ".join(modes)))
+        if actions:
+            raise ValueError("Progression cannot evaluate the reward, goal, termination or action preconditions of {} "
+                             "after {}: they must only read fluents listed in fluentList, ccStateShapeInfo, "
+                             "transStateStructure or restoreSitArg"
+                             .format(file, ", ".join(actions)))
+
+    def takeOverModule(self,file):
+        # The module of a closed engine already holds the domain, as loaded 
+        # and with the same options.
+        st = time.perf_counter()
+        if (self.tabling):
+            self.query("raiseTableSpace(" + str(self.tableSpace) + ")")
+            self.tableGuard = True
+        self.key = self.moduleKey(file)
+        self.loadTime = time.perf_counter() - st
+        self.queryTime = 0
+
+    def sourceFiles(self,file):
+        # The domain and the files of the interface.
+        return [file] + sorted(glob.glob(os.path.join(os.path.dirname(IFACE_FILE), "*.pl")))
+
+    def moduleKey(self,file):
+        # What a module holds once file is loaded: the sources, by the hash of 
+        # their content as for compiled files, and the options that change what 
+        # is declared there.
+        return (os.path.abspath(file), tuple(self.contentHash(s) for s in self.sourceFiles(file)), 
+                self.progression, self.tabling)
+
+    def query(self,goal,rerunnable = True):
+        """
+        Runs a goal in the module of the engine.
+
+        Parameters
+        ----------
+        goal : String
+            The goal, without a terminating full stop.
+        rerunnable : bool, optional
+            Whether the goal may be run again from scratch should the tables fill
+            the table space (see tabledCall/1). Not so for goals whose side effects
+            a second run would not repeat alike, e.g. drawing random numbers. The
+            default is True.
+
+        Returns
+        -------
+        list[dict]
+            The solutions of the goal, as binding dictionaries.
+        """
+        st = time.perf_counter()
+        if (self.tableGuard and rerunnable):
+            goal = "tabledCall((" + goal + "))"
+        solutions = list(self.prolog.query(self.module + ":(" + goal + ")"))
+        self.queryTime += time.perf_counter() - st
+        return solutions
+
+    def consult(self,file):
+        # Into the module of the engine, along with the files it consults in 
+        # turn. SWI-Prolog lets a non-module file be consulted into one module 
+        # only, so engines after the first load copies (see DT-Golog-Loader.pl).
+        self.query("dtgLoader:loadEngineFile(" + self.module + ",'" + file + "')")
+
+    def getLoadTime(self):
+        """
+        Returns the time it took to load the interface and the domain.
+
+        Returns
+        -------
+        float
+            The wall-clock load time in seconds of the latest (re)load.
+        """
+        return self.loadTime
+
+    def getQueryTime(self):
+        """
+        Returns the time spent in queries so far, loading aside.
+
+        Returns
+        -------
+        float
+            The wall-clock query time in seconds.
+        """
+        return self.queryTime
+
+    #
+    # Q U I C K   L O A D   F I L E S
+    #
+    # X.qlf is compiled from X.pl by SWI-Prolog. X.qlf.sha256 holds the hash 
+    # of the content X.qlf was compiled from.
+
+    def qlfPaths(self,source):
+        qlf = os.path.splitext(source)[0] + ".qlf"
+        return qlf, qlf + ".sha256"
+
+    def contentHash(self,source):
+        with open(source, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def dropStaleQlf(self,sources):
+        # Remove the compiled files whose source has changed since compilation, 
+        # so that SWI-Prolog compiles them anew.
+        for source in sources:
+            qlf, hashFile = self.qlfPaths(source)
+            if not os.path.exists(qlf):
+                continue
+            recorded = None
+            if os.path.exists(hashFile):
+                with open(hashFile) as f:
+                    recorded = f.read().strip()
+            if (recorded != self.contentHash(source)):
+                os.remove(qlf)
+
+    def recordQlf(self,sources):
+        for source in sources:
+            qlf, hashFile = self.qlfPaths(source)
+            if os.path.exists(qlf):
+                with open(hashFile, "w") as f:
+                    f.write(self.contentHash(source))
         
+    def situationTerm(self,eH):
+        """
+        Turns an effect history into the Prolog term that stands for its situation.
+
+        Parameters
+        ----------
+        eH : String or SituationHandle
+            Either a string of the form "i_1, i_2, ..." or a handle obtained by newHandle().
+
+        Returns
+        -------
+        String
+            A list term "[i_1, i_2, ...]" or a handle term "h(H)".
+        """
+        if isinstance(eH, SituationHandle):
+            return "h(" + str(eH.id) + ")"
+        return "[" + eH + "]"
+
+    def newHandle(self):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return SituationHandle(self.query("newSitHandle(H)")[0]['H'])
+
+    def advance(self,handle,stochIdx):
+        """
+        [Refer to QMI function documentation.]
+        """
+        self.query("advanceSitHandle(" + str(handle.id) + "," + str(stochIdx) + ")")
+        handle.history.append(stochIdx)
+
+    def resetHandle(self,handle):
+        """
+        [Refer to QMI function documentation.]
+        """
+        self.query("resetSitHandle(" + str(handle.id) + ")")
+        handle.history = []
+
+    def setHandle(self,handle,history):
+        """
+        [Refer to QMI function documentation.]
+        """
+        self.query("setSitHandle(" + str(handle.id) + ",[" + ",".join([str(x) for x in history]) + "])")
+        handle.history = list(history)
+
+    def freeHandle(self,handle):
+        """
+        [Refer to QMI function documentation.]
+        """
+        self.query("freeSitHandle(" + str(handle.id) + ")")
+
     def possibleAt(self,t, eH):
         """
         [Refer to QMI function documentation.]
         """
-        query = "possibleAt([" + eH + "], " + str(t) + ")."
-        if (list(self.prolog.query(query))):
+        query = "possibleAt(" + self.situationTerm(eH) + ", " + str(t) + ")"
+        if (self.query(query)):
             result = True
         else:
             result = False
@@ -41,63 +321,88 @@ class QueryEngine(QMI):
         """
         [Refer to QMI function documentation.]
         """
-        query = "getActionOutcomes(" + str(t) + ",[" + eH + "],SActs,Probs)."
-        possStochActions = list(self.prolog.query(query))[0]['SActs']
-        probs = list(self.prolog.query(query))[0]['Probs']
-        return possStochActions, probs
+        query = "getActionOutcomes(" + str(t) + "," + self.situationTerm(eH) + ",SActs,Probs)"
+        outcomes = self.query(query)[0]
+        return outcomes['SActs'], outcomes['Probs']
     
     def getProbs(self,t,eH):
         """
         [Refer to QMI function documentation.]
         """
-        query = "getActionOutcomes(" + str(t) + ",[" + eH + "],SActs,Probs)."
-        possStochActions = list(self.prolog.query(query))[0]['SActs']
-        probs = list(self.prolog.query(query))[0]['Probs']
-        return possStochActions, probs
+        query = "getActionOutcomes(" + str(t) + "," + self.situationTerm(eH) + ",SActs,Probs)"
+        outcomes = self.query(query)[0]
+        return outcomes['SActs'], outcomes['Probs']
         
     def reward(self,eH):
         """
         [Refer to QMI function documentation.]
         """
-        query = "getRewardRL([" + eH + "],R)."
-        reward = list(self.prolog.query(query))[0]['R']
+        query = "getRewardRL(" + self.situationTerm(eH) + ",R)"
+        reward = self.query(query)[0]['R']
         return reward
     
     def getState(self,eH):
         """
         [Refer to QMI function documentation.]
         """
-        query = "getState([" + eH + "],State)."
-        bitState = list(self.prolog.query(query))[0]['State']
+        query = "getState(" + self.situationTerm(eH) + ",State)"
+        bitState = self.query(query)[0]['State']
         return bitState
     
     def getConState(self,eH):
         """
         [Refer to QMI function documentation.]
         """
-        query = "getCCState([" + eH + "],State)."
-        ccState = list(self.prolog.query(query))[0]['State']
+        query = "getCCState(" + self.situationTerm(eH) + ",State)"
+        ccState = self.query(query)[0]['State']
         return ccState
 
     def getRun(self,eH):
         """
         [Refer to QMI function documentation.]
         """
-        query = "getRun([" + eH + "],C)."
-        currentRun = list(self.prolog.query(query))[0]['C']
+        query = "getRun(" + self.situationTerm(eH) + ",C)"
+        currentRun = self.query(query)[0]['C']
         return currentRun
             
     def done(self,eH):
         """
         [Refer to QMI function documentation.]
         """
-        s = "done([" + eH + "])."
-        if (list(self.prolog.query(s))):
+        s = "done(" + self.situationTerm(eH) + ")"
+        if (self.query(s)):
             result = True
         else:
             result = False
         return result            
     
+    def stepInfo(self,eH,fields = ("TransState","Mask")):
+        """
+        [Refer to QMI function documentation.]
+        """
+        selector = "[" + ",".join([f[0].lower() + f[1:] for f in fields]) + "]"
+        query = "stepInfo(" + self.situationTerm(eH) + "," + selector + ",R,State,CCState,Done,Achieved,TransState,Mask)"
+        res = self.query(query)[0]
+        info = {"Reward": res['R'],
+                "State": res['State'],
+                "CCState": res['CCState'],
+                "Done": (res['Done'] == 1),
+                "Achieved": (res['Achieved'] == 1)
+                }
+        if ("TransState" in fields):
+            info["TransState"] = str(res['TransState']).replace("'","")
+        if ("Mask" in fields):
+            info["Mask"] = [(b == 1) for b in res['Mask']]
+        return info
+
+    def feasibleMask(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        query = "feasibleMask(" + self.situationTerm(eH) + ",Mask)"
+        mask = self.query(query)[0]['Mask']
+        return [(b == 1) for b in mask]
+    
     def getDomainParams(self):
         """
         Returns various size parameters of the domain.
@@ -114,11 +419,11 @@ class QueryEngine(QMI):
             Returns a string on wether the state is to be discrete (a bit list) or continuous (a list of real values).
         """
         
-        actionSize = list(self.prolog.query("actionSize(L)."))[0]['L']
-        stateSize = list(self.prolog.query("stateSizeBits(S)."))[0]['S']
-        numRuns = list(self.prolog.query("getNumRuns(R)."))[0]['R']
-        bitState = list(self.prolog.query("getState([],S)."))[0]['S']
-        obsType = list(self.prolog.query("getObsType(X)."))[0]['X']
+        actionSize = self.query("actionSize(L)")[0]['L']
+        stateSize = self.query("stateSizeBits(S)")[0]['S']
+        numRuns = self.query("getNumRuns(R)")[0]['R']
+        bitState = self.query("getState([],S)")[0]['S']
+        obsType = self.query("getObsType(X)")[0]['X']
         actualStateSize = 2**(stateSize*numRuns)
         return actionSize,actualStateSize,[bitState]*numRuns,obsType,numRuns
     
@@ -132,7 +437,7 @@ class QueryEngine(QMI):
             The first is the list of terms designated for state representation, and the second and third the minimum and maximum values of each of these terms.
 
         """
-        shapeInfo = list(self.prolog.query("getStateShapeInfo(T,Min,Max)."))[0]
+        shapeInfo = self.query("getStateShapeInfo(T,Min,Max)")[0]
         return shapeInfo
  
     def achieved(self,eH):
@@ -150,8 +455,8 @@ class QueryEngine(QMI):
             True if the root goal is achieved at eH, false otherwise.
 
         """
-        s = "achieved([" + eH + "])."
-        if (list(self.prolog.query(s))):
+        s = "achieved(" + self.situationTerm(eH) + ")"
+        if (self.query(s)):
             result = True
         else:
             result = False
@@ -172,8 +477,8 @@ class QueryEngine(QMI):
 
         """
         #print("Getting trans state for {}".format(eH))
-        s = "getTransState([" + eH + "],X)."
-        ts = str(list(self.prolog.query(s))[0]['X'])
+        s = "getTransState(" + self.situationTerm(eH) + ",X)"
+        ts = str(self.query(s)[0]['X'])
         return(ts.replace("'",""))
 
     def setTransState(self, tS):
@@ -190,11 +495,42 @@ class QueryEngine(QMI):
         None.
 
         """
-        self.prolog.retractall("init(_)")
+        self.query("retractall(init(_))")
         s = "init(" + tS + ")"
         #print("Asserting: {}".format(s))
-        self.prolog.assertz(s)
+        self.query("assertz(" + s + ")")
+        # Tabled answers may have been derived from the previous initial state.
+        if (self.tabling):
+            self.query("resetTables")
     
+    def rollout(self, episodes, policy = [], seed = None, forgivePenalty = True):
+        """
+        Simulates whole episodes within Prolog, from the initial situation under 
+        the cross-run state currently set, which is set again when done.
+
+        Parameters
+        ----------
+        episodes : integer
+            The number of episodes.
+        policy : list of integers, optional
+            Agent actions attempted in order, the last one repeatedly if an episode 
+            outlasts the list. The default is [], for actions picked at random.
+        seed : integer, optional
+            The seed of Prolog's random number generator. The default is None (not reseeded).
+        forgivePenalty : boolean, optional
+            Leave infeasible action penalties out of the returns. The default is True.
+
+        Returns
+        -------
+        list of floats
+            The return of every episode.
+        """
+        s = "rolloutEpisodes(" + str(episodes) + ",[" + ",".join([str(a) for a in policy]) + "]," + \
+            ("none" if seed is None else str(seed)) + "," + ("1" if forgivePenalty else "0") + ",Rewards)"
+        # Not run again on a table space overflow: the random number generator
+        # has moved on by then, and seeded rollouts would differ.
+        return [float(r) for r in self.query(s, rerunnable = False)[0]['Rewards']]
+
     def getInfeasibleActionPenalty (self):
         """
         Retrieves the reward penalty for invoking an infeasible action.
@@ -205,10 +541,21 @@ class QueryEngine(QMI):
             The penalty incurred by the attempt of the infeasible action.
 
         """
-        s = "getInfeasiblePenalty(P)."
-        penalty = list(self.prolog.query(s))[0]['P']
+        s = "getInfeasiblePenalty(P)"
+        penalty = self.query(s)[0]['P']
         return penalty
     
+    def resetEngine(self):
+        """
+        Brings the engine back to the state it was loaded in: the initial state 
+        (init/1) of the domain, no progressed situations and no tables. For an 
+        engine to be handed to another environment (see QueryEnginePool).
+        """
+        self.query("releaseEngine")
+
     def close(self):
-        self.prolog.retractall("init(_)")
+        # The module is not unloaded, but left, as it was loaded, for the next 
+        # engine of the same domain and options to take over.
+        self.resetEngine()
+        freeModules.setdefault(self.key, []).append(self.module)
         del self.prolog
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Query engines running in worker processes.
+
+pyswip gives each process a single Prolog engine: query engines of one process
+live in modules of their own, but their queries run one at a time. A
+RemoteQueryEngine runs its QueryEngine in a worker process of its own and forwards
+every call to it over a pipe, offering the same QMI method surface. Waiting on the
+pipe releases the GIL, so environments built on different remote engines can step
+concurrently from threads, or through submit()/result() from a single one.
+
+@author: Anonymous
+"""
+
+import multiprocessing as mp
+from .QMI import QMI, SituationHandle
+
+
+def portable(value):
+    # Results are sent back through a pipe: terms pyswip could not turn into
+    # Python values (e.g. compound terms) travel as their text.
+    if isinstance(value, (bool, int, float, str, HandleRef)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return type(value)([portable(v) for v in value])
+    if isinstance(value, dict):
+        return {k: portable(v) for k, v in value.items()}
+    return str(value)
+
+
+class HandleRef:
+    """
+    What travels through the pipe in place of a SituationHandle: its id only. The
+    worker keeps the handle, history included, and the caller its own copy.
+    """
+    def __init__(self,hid):
+        self.id = hid
+
+
+def serveQueryEngine(conn,file,options):
+    """
+    The loop of a worker process: loads the domain into a QueryEngine and answers
+    (method, args) requests until the connection is closed or None is received.
+    Should loading fail, every request but close is answered with the error.
+    """
+    from .QueryEngine import QueryEngine
+    try:
+        qe = QueryEngine(file, **options)
+        failure = None
+    except Exception as e:
+        failure = "{}: {}".format(type(e).__name__, e)
+    # The handles of the engine by id, as the calls refer to them.
+    handles = {}
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        name, args = request
+        if failure is not None:
+            conn.send((True, None) if (name == "close") else (False, failure))
+            continue
+        try:
+            args = [handles[a.id] if isinstance(a, HandleRef) else a for a in args]
+            result = getattr(qe, name)(*args)
+            if (name == "newHandle"):
+                handles[result.id] = result
+                result = HandleRef(result.id)
+            elif (name == "freeHandle"):
+                del handles[args[0].id]
+            conn.send((True, portable(result)))
+        except Exception as e:
+            conn.send((False, "{}: {}".format(type(e).__name__, e)))
+    conn.close()
+
+
+class RemoteQueryEngine(QMI):
+    """
+    A QMI whose QueryEngine lives in a separate worker process.
+    """
+
+    def __init__(self,file,**options):
+        """
+        Starts the worker process. The domain is loaded by the worker while the
+        caller goes on; the first call waits for it.
+
+        Parameters
+        ----------
+        file : String
+            The path of the domain specification.
+        **options :
+            Keyword arguments of the QueryEngine constructor (progression, tabling, ...).
+        """
+        ctx = mp.get_context("spawn")
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target = serveQueryEngine, args = (child, file, options), daemon = True)
+        self.process.start()
+        child.close()
+        self.pending = None
+
+    def submit(self,name,*args):
+        """
+        Sends a call to the worker without waiting for its result, which is to be
+        collected with result(). Allows several engines to work at the same time.
+        """
+        assert self.pending is None, "A previous call has not been collected"
+        # Handles are sent as their ids: the worker has its own copy, which the
+        # handle methods below keep in step with the caller's.
+        self.conn.send((name, tuple([HandleRef(a.id) if isinstance(a, SituationHandle) else a for a in args])))
+        self.pending = name
+
+    def result(self):
+        """
+        Waits for and returns the result of the latest submit().
+        """
+        self.pending = None
+        ok, result = self.conn.recv()
+        if not ok:
+            raise RuntimeError("Remote query engine: " + result)
+        if isinstance(result, HandleRef):
+            result = SituationHandle(result.id)
+        return result
+
+    def call(self,name,*args):
+        self.submit(name, *args)
+        return self.result()
+
+    def __getattr__(self,name):
+        # Methods beyond the QMI ones (getDomainParams, setTransState, ...).
+        if name.startswith("__") or name in ("conn", "process", "pending"):
+            raise AttributeError(name)
+        return lambda *args: self.call(name, *args)
+
+    #
+    # Q M I
+    #
+
+    def setFile(self,file):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("setFile", file)
+
+    def possibleAt(self,t,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("possibleAt", t, eH)
+
+    def getOutcomes(self,t,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("getOutcomes", t, eH)
+
+    def getProbs(self,t,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("getProbs", t, eH)
+
+    def reward(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("reward", eH)
+
+    def getState(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("getState", eH)
+
+    def getConState(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("getConState", eH)
+
+    def getRun(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("getRun", eH)
+
+    def done(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("done", eH)
+
+    def stepInfo(self,eH,fields = ("TransState","Mask")):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("stepInfo", eH, fields)
+
+    def feasibleMask(self,eH):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("feasibleMask", eH)
+
+    def newHandle(self):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("newHandle")
+
+    def advance(self,handle,stochIdx):
+        """
+        [Refer to QMI function documentation.]
+        """
+        self.call("advance", handle, stochIdx)
+        handle.history.append(stochIdx)
+
+    def resetHandle(self,handle):
+        """
+        [Refer to QMI function documentation.]
+        """
+        self.call("resetHandle", handle)
+        handle.history = []
+
+    def setHandle(self,handle,history):
+        """
+        [Refer to QMI function documentation.]
+        """
+        self.call("setHandle", handle, list(history))
+        handle.history = list(history)
+
+    def freeHandle(self,handle):
+        """
+        [Refer to QMI function documentation.]
+        """
+        return self.call("freeHandle", handle)
+
+    def resetEngine(self):
+        """
+        [Refer to QueryEngine function documentation.]
+        """
+        return self.call("resetEngine")
+
+    def close(self):
+        """
+        Closes the engine and stops the worker process.
+        """
+        if not self.process.is_alive():
+            return
+        self.call("close")
+        self.conn.send(None)
+        self.process.join()
+        self.conn.close()
+
+
+class QueryEnginePool:
+    """
+    A fixed set of RemoteQueryEngine workers for the same domain, handed out to
+    environments one at a time. All workers load the domain concurrently.
+    """
+
+    def __init__(self,file,size,**options):
+        """
+        Parameters
+        ----------
+        file : String
+            The path of the domain specification.
+        size : integer
+            The number of worker processes.
+        **options :
+            Keyword arguments of the QueryEngine constructor.
+        """
+        self.engines = [RemoteQueryEngine(file, **options) for _ in range(size)]
+        self.free = list(self.engines)
+
+    def acquire(self):
+        """
+        Returns an engine no one else is using, e.g. to be given to GMEnv(file, qmi = ...).
+        """
+        if not self.free:
+            raise RuntimeError("All {} query engines of the pool are in use".format(len(self.engines)))
+        return self.free.pop()
+
+    def release(self,engine):
+        """
+        Gives an engine obtained through acquire() back to the pool, as it was
+        loaded: whatever the environment left (cross-run state, progressed
+        situations, tables) is dropped.
+        """
+        engine.resetEngine()
+        self.free.append(engine)
+
+    def close(self):
+        for engine in self.engines:
+            engine.close()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Exact solution of exported MDPs.
+
+@author: Anonymous
+"""
+
+import numpy as np
+from .MDPExport import MDPExporter
+
+
+def valueIteration(mdp,gamma = 1.0,tol = 1e-10,maxIter = None):
+    """
+    Computes the optimal expected reward and policy of an MDP exported by
+    MDPExporter, following GMEnv semantics: an infeasible action earns the
+    penalty and ends the episode, and no more reward is collected once the
+    episode is done.
+
+    Parameters
+    ----------
+    mdp : dict
+        The arrays of MDPExporter.explore() or loadMDP().
+    gamma : float, optional
+        The discount factor. The default is 1.0 (expected total reward).
+    tol : float, optional
+        Stop once no state value changes by more than that. The default is 1e-10.
+    maxIter : integer, optional
+        The maximum number of sweeps, at least one. The default is the number
+        of states, which suffices for the acyclic state spaces of goal models
+        (every step either attempts a new action or concludes a run).
+
+    Returns
+    -------
+    dict
+        "value": the optimal expected reward from the initial state,
+        "V": the optimal value of every state,
+        "Q": the value of every state and action,
+        "policy": an optimal action for every state,
+        "iterations": the number of sweeps performed.
+    """
+    S, A = mdp["R"].shape
+    if (S == 0):
+        raise ValueError("The MDP has no states, not even an initial one")
+    if (maxIter is None):
+        maxIter = S + 1
+    elif (maxIter < 1):
+        raise ValueError("Value iteration needs at least one sweep, not maxIter = {}".format(maxIter))
+    # Index of the (state, action) pair of every transition.
+    pairs = mdp["P_s"]*A + mdp["P_a"]
+    live = ~mdp["done"]
+    V = np.zeros(S)
+    iterations = 0
+    while (iterations < maxIter):
+        iterations += 1
+        future = np.bincount(pairs, weights = mdp["P_prob"]*V[mdp["P_next"]], minlength = S*A).reshape(S, A)
+        Q = mdp["R"] + gamma*future
+        newV = np.where(live, Q.max(axis = 1), 0.0)
+        delta = np.max(np.abs(newV - V))
+        V = newV
+        if (delta <= tol):
+            break
+    return {"value": V[0],
+            "V": V,
+            "Q": Q,
+            "policy": Q.argmax(axis = 1),
+            "iterations": iterations}
+
+
+def solveDomain(file,maxStates = None,gamma = 1.0):
+    """
+    Explores the domain specified in file (see MDPExporter) and solves it by
+    value iteration. The exploration merges histories that lead to the same
+    state and raises a ValueError if merged histories turn out to disagree, so
+    the result is exact for the domains it is returned for.
+
+    Parameters
+    ----------
+    file : String
+        The path of the domain specification.
+    maxStates : integer, optional
+        Give up when more states than that are reached. The default is None (no limit).
+    gamma : float, optional
+        The discount factor. The default is 1.0 (expected total reward).
+
+    Returns
+    -------
+    dict
+        The result of valueIteration.
+    """
+    exporter = MDPExporter(file, maxStates = maxStates)
+    try:
+        mdp = exporter.explore()
+    finally:
+        exporter.close()
+    return valueIteration(mdp, gamma = gamma)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming statistics of simulation results.
+
+@author: Anonymous
+"""
+
+import math
+import numpy as np
+
+
+class RunningStats:
+    """
+    Count, mean and variance of a stream of values, updated one value at a time
+    (Welford) without keeping the values. Accumulators of separate parts of a
+    stream can be merged (Chan et al.), which gives the same result as long as
+    the parts are merged in the same order.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        # The sum of squared differences from the mean.
+        self.m2 = 0.0
+
+    def add(self,x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(x - self.mean)
+
+    def merge(self,other):
+        """
+        Adds the values of another accumulator to this one.
+        """
+        if (other.count == 0):
+            return self
+        if (self.count == 0):
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta*other.count/count
+        self.m2 += other.m2 + delta*delta*self.count*other.count/count
+        self.count = count
+        return self
+
+    def variance(self):
+        """
+        The sample variance (zero for fewer than two values).
+        """
+        return self.m2/(self.count - 1) if (self.count > 1) else 0.0
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+    def stderr(self):
+        """
+        The standard error of the mean.
+        """
+        return math.sqrt(self.variance()/self.count) if (self.count > 0) else 0.0
+
+
+def summarizeEpisodes(records,percentiles = (5, 25, 50, 75, 95)):
+    """
+    Summary statistics of the episode records of a simulation (see
+    Tester.EPISODE_DTYPE).
+
+    Returns
+    -------
+    dict
+        "episodes": the number of episodes,
+        "mean", "std", "min", "max": of the episode returns,
+        "percentiles": the given percentiles of the returns, by percentile,
+        "meanLength", "meanInfeasible", "meanRuns": the mean steps, infeasible
+        attempts and concluded runs per episode (None if not recorded).
+    """
+    rewards = records["reward"]
+    n = len(records)
+    summary = {"episodes": n,
+               "mean": float(rewards.mean()) if n else 0.0,
+               "std": float(rewards.std(ddof = 1)) if (n > 1) else 0.0,
+               "min": float(rewards.min()) if n else 0.0,
+               "max": float(rewards.max()) if n else 0.0,
+               "percentiles": dict(zip(percentiles, np.percentile(rewards, percentiles).tolist())) if n else {}}
+    for key, field in (("meanLength", "length"), ("meanInfeasible", "infeasible"), ("meanRuns", "runs")):
+        known = records[field][records[field] >= 0]
+        summary[key] = float(known.mean()) if len(known) else None
+    return summary
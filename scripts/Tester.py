@@ -11,10 +11,51 @@ from stable_baselines3 import A2C
 from stable_baselines3 import DQN
 from stable_baselines3 import PPO
 from stable_baselines3.common.monitor import Monitor
+from stable_baselines3.common.vec_env import DummyVecEnv
+from .VecGMEnv import makeVecGMEnv
+from .Stats import RunningStats, summarizeEpisodes
 
+from statistics import NormalDist
+import multiprocessing as mp
+import numpy as np
 import sys
 import time
 
+# The number of episodes per unit of work of seeded simulations.
+SIM_CHUNK = 100
+
+# The record of every simulated episode: its return, the steps it took, the 
+# infeasible actions it attempted and the runs it concluded (-1 if unknown).
+EPISODE_DTYPE = np.dtype([("reward", np.float64), ("length", np.int32),
+                          ("infeasible", np.int32), ("runs", np.int32)])
+
+def episodeBuffer(episodes, path = None):
+    # Room for the records of that many episodes, in memory or, given a path, 
+    # in a .npy file mapped to memory.
+    if path is None:
+        return np.zeros(episodes, dtype = EPISODE_DTYPE)
+    return np.lib.format.open_memmap(path, mode = "w+", dtype = EPISODE_DTYPE, shape = (episodes,))
+
+# The tester of a simulation worker process (see initSimulationWorker).
+workerTester = None
+
+def initSimulationWorker(envClass, file, envArgs):
+    global workerTester
+    workerTester = TestIt(envClass(file, **envArgs))
+
+def simulateChunk(chunk, tester = None):
+    # Runs the episodes of a chunk, one per seed, and returns their statistics
+    # and records.
+    policy, forgivePenalty, masked, seeds = chunk
+    if tester is None:
+        tester = workerTester
+    stats = RunningStats()
+    records = episodeBuffer(len(seeds))
+    for i, seed in enumerate(seeds):
+        stats.add(tester.runEpisode(policy, forgivePenalty, masked, seed))
+        records[i] = tester.lastEpisode
+    return stats, records
+
 class TestIt():
     def __init__(self,environment):
         self.env = environment
@@ -50,117 +91,415 @@ class TestIt():
         return n_state,reward,self.score, terminated or truncated,info
 
         
-    def simulate(self,episodes,policy = [],debug = False, forgivePenalty = True):
-        totalScore = 0
+    def simulate(self,episodes,policy = [],debug = False, forgivePenalty = True, masked = False, inProlog = False, workers = None, seed = None,
+                 recordPath = None, summary = False):
+        # forgivePenalty: leave the penalty of infeasible attempts (steps whose
+        # stAction is -1) out of the returns. Feasible steps count even if
+        # their reward equals the penalty, as in rollouts within Prolog and in
+        # evaluate_exact.
+        # masked: the random policy only picks among the actions the
+        # environment would accept (see GMEnv.action_masks).
+        # inProlog: run all episodes within Prolog in a single query 
+        # (see QueryEngine.rollout), seeding Prolog's random numbers with seed;
+        # masked and workers do not apply, and only the returns of the 
+        # episodes are recorded.
+        # workers, seed: see simulateSeeded.
+        # Every episode is recorded in self.episodes (see EPISODE_DTYPE), an 
+        # array preallocated in memory or, given recordPath, a .npy file mapped 
+        # to memory, and summarized in self.simSummary (see summarizeEpisodes), 
+        # which is returned instead of the mean reward if summary is set.
+        records = episodeBuffer(episodes, recordPath)
+        if inProlog:
+            self.requireQMI("Simulating within Prolog")
+            if (workers is not None):
+                raise ValueError("Simulating within Prolog runs in a single query; it cannot use workers")
+            print("Starting simulations within Prolog:")
+            self.env.reset()
+            rewards = self.env.qmi.rollout(episodes, policy, seed = seed, forgivePenalty = forgivePenalty)
+            self.env.reset()
+            records["reward"] = rewards
+            for field in ("length", "infeasible", "runs"):
+                records[field] = -1
+            print("Simulations complete.")
+            return self.recordEpisodes(records, sum(rewards)/episodes, summary)
         if policy:  
             print("Starting simulations on extraneously defined policy:")
         else:
             print("Starting random simulations:")
+        if (workers is not None) or (seed is not None):
+            result = self.simulateSeeded(episodes, policy, forgivePenalty, masked, workers, seed, records)
+            print("")
+            print("Simulations complete.")
+            return self.recordEpisodes(records, result, summary)
+        totalScore = 0
         for episode in range(1,episodes + 1):
             sys.stdout.write("\r\t%d%%" % ((episode/episodes)*100))
             sys.stdout.flush()
-            self.env.reset()
-            done = False
-            self.score = 0
-            pol = policy.copy()
-            
-            while not done:
-                self.env.render()
-                if not policy: 
-                    # Executing Random Policy
-                    #print("Random")
-                    #print(policy)
-                    action = self.env.action_space.sample()
-                elif pol:
-                    # Executing given policy
-                    action = pol.pop(0)
-                else: 
-                    print("Error: Failed to end deterministic policy")
-                    print("Requested policy: {}",format(policy))
-                    print("Actions left policy: {}",format(pol))
-                    print("Episode done: {}",format(done))
-                    
-                    # Executing given policy
-                    
-                    
-                n_state, reward, terminated, truncated, info = self.env.step(action)
-                done = terminated or truncated
-                if (reward != self.env.getInfeasiblePenalty()) or (not forgivePenalty):
-                    self.score += reward
-                
-                if self.debug: 
-                    print(' ')
-                    print('New Action Attempt:')
-                    print('--> Action: {}'.format(action))
-                    print('--> St. Action: {}'.format(info))
-                    print('--> State: {}'.format(n_state))
-                    print('--> Reward: {}'.format(reward))
-                    print('--> Cum. Reward: {}'.format(self.score))
-    
-                
-                #Check if you reached a deadlock
-                #print("Checking for deadlock:...")
-                #canExit = False
-                #for a in range(0,self.env.action_space.n - 1) :
-                #    canExit = canExit or self.env.possible(a) 
-                
-                #if (not canExit and not done):
-                #    print("**** Unspotted Deadlock! ***")
-                    #sl, sa, pos, bitst = self.env.debug()
-                    #print("**** ** SL: {}".format(sl))
-                    #print("**** ** AL: {}".format(sa))
-                    #print("**** ** Poss: {}".format(pos))
-                    #print("**** ** State: {}".format(bitst))
-                    #print("**** ** Last action:{} ****".format(action))
-                #    break
-                
-                if (policy and (not pol) and (not done)):
-                    print("**** Error: Failed to end deterministic policy ***")
-            
+            self.runEpisode(policy, forgivePenalty, masked)
             totalScore += self.score
+            records[episode - 1] = self.lastEpisode
             if debug:
                 print('Episode:{} Score:{}'.format(episode,self.score))
         #print('Simulation: average reward: {}'.format(totalScore/episodes))
         print("")
         print("Simulations complete.")
-        return(totalScore/episodes)
+        return self.recordEpisodes(records, totalScore/episodes, summary)
+
+    def recordEpisodes(self, records, mean, summary):
+        self.episodes = records
+        if isinstance(records, np.memmap):
+            records.flush()
+        self.simSummary = summarizeEpisodes(records)
+        return self.simSummary if summary else mean
+
+    def runEpisode(self, policy = [], forgivePenalty = True, masked = False, seed = None):
+        # Runs one episode of simulate() and returns its score; its record 
+        # (see EPISODE_DTYPE) is left in self.lastEpisode.
+        self.env.setMasked(masked)
+        self.env.reset(seed = seed)
+        done = False
+        self.score = 0
+        length = 0
+        infeasible = 0
+        pol = policy.copy()
+        
+        while not done:
+            self.env.render()
+            if not policy: 
+                # Executing Random Policy
+                #print("Random")
+                #print(policy)
+                if masked:
+                    action = self.env.action_space.sample(mask = self.env.action_masks().astype(np.int8))
+                else:
+                    action = self.env.action_space.sample()
+            elif pol:
+                # Executing given policy
+                action = pol.pop(0)
+            else: 
+                print("Error: Failed to end deterministic policy")
+                print("Requested policy: {}",format(policy))
+                print("Actions left policy: {}",format(pol))
+                print("Episode done: {}",format(done))
+                
+                # Executing given policy
+                
+                
+            n_state, reward, terminated, truncated, info = self.env.step(action)
+            done = terminated or truncated
+            length += 1
+            if (info["stAction"] == -1):
+                infeasible += 1
+            if (info["stAction"] != -1) or (not forgivePenalty):
+                self.score += reward
+            
+            if self.debug: 
+                print(' ')
+                print('New Action Attempt:')
+                print('--> Action: {}'.format(action))
+                print('--> St. Action: {}'.format(info))
+                print('--> State: {}'.format(n_state))
+                print('--> Reward: {}'.format(reward))
+                print('--> Cum. Reward: {}'.format(self.score))
+
+            
+            #Check if you reached a deadlock
+            #print("Checking for deadlock:...")
+            #canExit = False
+            #for a in range(0,self.env.action_space.n - 1) :
+            #    canExit = canExit or self.env.possible(a) 
+            
+            #if (not canExit and not done):
+            #    print("**** Unspotted Deadlock! ***")
+                #sl, sa, pos, bitst = self.env.debug()
+                #print("**** ** SL: {}".format(sl))
+                #print("**** ** AL: {}".format(sa))
+                #print("**** ** Poss: {}".format(pos))
+                #print("**** ** State: {}".format(bitst))
+                #print("**** ** Last action:{} ****".format(action))
+            #    break
+            
+            if (policy and (not pol) and (not done)):
+                print("**** Error: Failed to end deterministic policy ***")
+        self.lastEpisode = (self.score, length, infeasible, info["Run"])
+        return self.score
+
+    def simulateSeeded(self, episodes, policy, forgivePenalty, masked, workers, seed, records):
+        # Every episode is reset with a seed of its own, drawn from seed, and 
+        # the episodes are taken in chunks of fixed size whose statistics are 
+        # merged in order: the result depends on seed only, not on how many 
+        # workers (separate processes with their own GMEnv) share the chunks.
+        chunks = self.seededChunks(episodes, policy, forgivePenalty, masked, seed)
+        stats = RunningStats()
+        for part, partRecords in self.chunkResults(chunks, workers):
+            records[stats.count:stats.count + part.count] = partRecords
+            stats.merge(part)
+        self.simStats = stats
+        return stats.mean
+
+    def simulateAdaptive(self, targetHalfWidth, minEpisodes = 100, maxEpisodes = 10000, policy = [], 
+                         forgivePenalty = True, masked = False, confidence = 0.95, workers = None, seed = None,
+                         recordPath = None):
+        """
+        Simulates episodes as simulate() does, with per-episode seeds, until the
+        confidence interval of the mean reward is narrow enough.
+
+        Parameters
+        ----------
+        targetHalfWidth : float
+            Stop once the half-width of the confidence interval is at most that.
+        minEpisodes : integer, optional
+            Simulate at least that many episodes. The default is 100.
+        maxEpisodes : integer, optional
+            Simulate at most that many episodes. The default is 10000.
+        policy, forgivePenalty, masked, workers, seed :
+            As in simulate().
+        confidence : float, optional
+            The confidence level of the interval. The default is 0.95.
+        recordPath : String, optional
+            A .npy file to save the records of the episodes used to, once done
+            (their number is not known in advance). The default is None.
+
+        Returns
+        -------
+        mean : float
+            The mean reward.
+        interval : tuple of floats
+            The (normal approximation) confidence interval of the mean.
+        episodes : integer
+            The number of episodes simulated.
+        """
+        if policy:  
+            print("Starting adaptive simulations on extraneously defined policy:")
+        else:
+            print("Starting adaptive random simulations:")
+        z = NormalDist().inv_cdf(0.5 + confidence/2)
+        chunks = self.seededChunks(maxEpisodes, policy, forgivePenalty, masked, seed)
+        stats = RunningStats()
+        records = episodeBuffer(maxEpisodes)
+        # The stopping rule is checked after every chunk in order, so that the
+        # episodes used do not depend on the number of workers either.
+        results = self.chunkResults(chunks, workers, batch = True)
+        for part, partRecords in results:
+            records[stats.count:stats.count + part.count] = partRecords
+            stats.merge(part)
+            if (stats.count >= minEpisodes) and (z*stats.stderr() <= targetHalfWidth):
+                break
+        results.close()
+        self.simStats = stats
+        if recordPath is not None:
+            np.save(recordPath, records[:stats.count])
+        self.recordEpisodes(records[:stats.count], stats.mean, False)
+        halfWidth = z*stats.stderr()
+        print("")
+        print("Simulations complete ({} episodes).".format(stats.count))
+        return stats.mean, (stats.mean - halfWidth, stats.mean + halfWidth), stats.count
+
+    def seededChunks(self, episodes, policy, forgivePenalty, masked, seed):
+        seeds = [int(x) for x in np.random.SeedSequence(seed).generate_state(episodes)]
+        return [(policy, forgivePenalty, masked, seeds[i:i + SIM_CHUNK]) 
+                for i in range(0, episodes, SIM_CHUNK)]
+
+    def chunkResults(self, chunks, workers, batch = False):
+        # The statistics and records of the chunks, in order: computed here, or by a pool 
+        # of workers, all at once or (batch) as many at a time as there are 
+        # workers, so that a caller may stop early without waste.
+        if (workers is None) or (workers <= 1):
+            for i, chunk in enumerate(chunks):
+                sys.stdout.write("\r\t%d%%" % (((i + 1)/len(chunks))*100))
+                sys.stdout.flush()
+                yield simulateChunk(chunk, self)
+            return
+        self.requireRebuildable("Simulating on several workers")
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(workers, initializer = initSimulationWorker, 
+                      initargs = (type(self.env), self.env.file, self.env.envArgs)) as pool:
+            if not batch:
+                yield from pool.imap(simulateChunk, chunks)
+                return
+            for i in range(0, len(chunks), workers):
+                yield from pool.map(simulateChunk, chunks[i:i + workers])
+
+    def requireQMI(self, what):
+        # Environments that step from tables (GMTableEnv) have no query engine.
+        if getattr(self.env, "qmi", None) is None:
+            raise ValueError("{} needs an environment with a query engine (the prolog backend), not {}"
+                             .format(what, type(self.env).__name__))
 
+    def evaluate_exact(self, policy, forgivePenalty = True):
+        """
+        The expected reward of simulate(episodes, policy, forgivePenalty = ...)
+        as the number of episodes grows, computed by walking the tree of
+        outcomes of the policy with their probabilities instead of sampling.
+        Branches that reach the same situation (the same history of the run,
+        from the same cross-run state) at the same point of the policy are
+        evaluated once. The state bits alone would not do: rewards may depend
+        on fluents outside them, such as cumulative ones.
 
-    def test_learning(self, learn_iter = 10_000, test_iter = 10000,logging= 1000, algo = "A2C"):
+        Parameters
+        ----------
+        policy : list of integers
+            The agent actions to attempt in order. As in simulate(), the last
+            one is attempted again if the episode outlasts the list. Not empty:
+            the random policy of simulate() is not supported.
+        forgivePenalty : boolean, optional
+            Do not count infeasible action penalties. The default is True.
+
+        Returns
+        -------
+        float
+            The expected reward of the policy.
+        """
+        self.requireQMI("Exact policy evaluation")
+        if not policy:
+            raise ValueError("Exact policy evaluation needs a list of actions; random policies are not supported")
+        qmi = self.env.qmi
+        penalty = self.env.getInfeasiblePenalty()
+        runsNum = self.env.runsNum
+        asserted = [None]
+        infos = {}
+        memo = {}
+
+        def situationInfo(startTrans, history):
+            key = (startTrans, tuple(history))
+            if key not in infos:
+                if (asserted[0] != startTrans):
+                    qmi.setTransState(startTrans)
+                    asserted[0] = startTrans
+                infos[key] = qmi.stepInfo(",".join([str(x) for x in history]))
+            return infos[key]
+
+        def value(pos, run, tried, history, startTrans):
+            if (run == runsNum):
+                return 0
+            # All the query engine answers depends on the cross-run state and
+            # the history of the run, which also gives the actions tried.
+            key = (min(pos, len(policy)), run, startTrans, tuple(history))
+            if key in memo:
+                return memo[key]
+            info = situationInfo(startTrans, history)
+            if info["Done"]:
+                return 0
+            action = policy[min(pos, len(policy) - 1)]
+            if (action in tried) or (not info["Mask"][action]):
+                # Infeasible: the episode ends with the penalty.
+                result = 0 if forgivePenalty else penalty
+            else:
+                if (asserted[0] != startTrans):
+                    qmi.setTransState(startTrans)
+                    asserted[0] = startTrans
+                outcomes, probs = qmi.getOutcomes(action, ",".join([str(x) for x in history]))
+                result = 0
+                for o, p in zip(outcomes, probs):
+                    nextInfo = situationInfo(startTrans, history + [o])
+                    if nextInfo["Achieved"]:
+                        after = value(pos + 1, run + 1, (), [], nextInfo["TransState"])
+                    else:
+                        after = value(pos + 1, run, tuple(sorted(tried + (action,))), history + [o], startTrans)
+                    result += p*(nextInfo["Reward"] + after)
+            memo[key] = result
+            return result
+
+        result = value(0, 0, (), [], self.env.initTransState)
+        # Leave the engine as a fresh episode expects it.
+        self.env.reset()
+        return result
+
+
+    def trainingEnv(self, numEnvs = 1, seed = None, sharedMemory = False):
+        # The environment learning runs on: the tester's own, or numEnvs 
+        # copies of it in worker processes (see VecGMEnv).
+        if (numEnvs <= 1):
+            return Monitor(self.env,info_keywords=("is_success",))
+        self.requireRebuildable("Learning on several environments")
+        return makeVecGMEnv(self.env.file, numEnvs, seed, sharedMemory = sharedMemory, 
+                            envClass = type(self.env), **self.env.envArgs)
+
+    def requireRebuildable(self, what):
+        # Copies of the environment are built from its class, file and envArgs,
+        # which do not capture a query engine the caller constructed (e.g. a 
+        # RemoteQueryEngine): rather than have the copies silently use another.
+        if getattr(self.env, "givenQMI", False):
+            raise ValueError("{} builds copies of the environment, which cannot use the query engine "
+                             "it was given; construct it from the domain file instead".format(what))
+
+    def test_learning(self, learn_iter = 10_000, test_iter = 10000,logging= 1000, algo = "A2C", numEnvs = 1, seed = None, sharedMemory = False,
+                      testBatch = None):
+        # Returns the mean reward of the learned policy over test_iter episodes,
+        # the optimizer parameters and the throughput of learning and of 
+        # testing, as {"learning": ..., "testing": ...} (see phaseStats).
+        # testBatch: test with evaluatePolicy over that many environments, 
+        # episodes seeded from seed, instead of one episode after the other on 
+        # the learning environment.
         
         st = time.process_time()
+        wst = time.perf_counter()
+        # Learning on worker processes starts them, and their query engines, afresh.
+        queryStart = self.env.getQueryTime() if (numEnvs <= 1) else 0.0
         print("Attempting {} model construction.".format(algo))
+        # Only a masked learner has its episodes end once no valid action is 
+        # left (see GMEnv.done()); copies of the environment follow envArgs.
+        self.env.setMasked(algo == "MaskablePPO")
         
         if (algo == "A2C"):
-            self.envm = Monitor(self.env,info_keywords=("is_success",))
+            self.envm = self.trainingEnv(numEnvs, seed, sharedMemory)
             model = A2C("MlpPolicy", self.envm, verbose=1)
             print("Model Constructed. Learning starts...")
             model.learn(total_timesteps=learn_iter,log_interval = logging)
         elif (algo == "DQN"):
-            self.envm = Monitor(self.env,info_keywords=("is_success",))
+            self.envm = self.trainingEnv(numEnvs, seed, sharedMemory)
             model = DQN("MlpPolicy", self.envm, verbose=1)
             print("Model Constructed. Learning starts...")
             model.learn(total_timesteps=learn_iter,log_interval = logging)
         elif (algo == "PPO"):
-            self.envm = Monitor(self.env,info_keywords=("is_success",))
+            self.envm = self.trainingEnv(numEnvs, seed, sharedMemory)
             model = PPO("MlpPolicy", self.envm, verbose=1)
             print("Model Constructed. Learning starts...")
             model.learn(total_timesteps=learn_iter,log_interval = logging)
+        elif (algo == "MaskablePPO"):
+            # Optional dependency: sb3-contrib
+            from sb3_contrib import MaskablePPO
+            self.envm = self.trainingEnv(numEnvs, seed, sharedMemory)
+            model = MaskablePPO("MlpPolicy", self.envm, verbose=1)
+            print("Model Constructed. Learning starts...")
+            model.learn(total_timesteps=learn_iter,log_interval = logging)
         else:
             print("Uknown learning algorithm")
             return
         vec_env = model.get_env()
-        obs = vec_env.reset()
+        # Time
+        et = time.process_time()
+        wet = time.perf_counter()
+        res = et - st
+        queryEnd = vec_env.env_method("getQueryTime")
+        stats = {"learning": self.phaseStats(wet - wst, res, model.num_timesteps,
+                                        sum(len(x) for x in vec_env.env_method("get_episode_lengths")),
+                                        [queryStart]*len(queryEnd), queryEnd)}
         params = model.get_parameters().get("policy.optimizer").get("param_groups")
+        if (numEnvs > 1):
+            # Testing does not use the workers: stop them, their query engines 
+            # and any shared memory blocks with them.
+            self.envm.close()
         
+        print('Learning Complete. Leargning CPU Execution time:', res, 'seconds')
+        if (testBatch is not None):
+            result = self.evaluatePolicy(model, test_iter, testBatch, masked = (algo == "MaskablePPO"), seed = seed)
+            stats["testing"] = self.evalStats
+            return result, params, stats
+
+        if (numEnvs > 1):
+            # Test one episode at a time on the tester's own environment: the
+            # workers would all step along, only the first of them counted.
+            vec_env = DummyVecEnv([lambda: Monitor(self.env,info_keywords=("is_success",))])
+        obs = vec_env.reset()
         totalReward = 0
         totalIter = test_iter
         
-        # Time
-        et = time.process_time()
-        res = et - st
-        print('Learning Complete. Leargning CPU Execution time:', res, 'seconds')
         print("Starting testing..")
+        st = time.process_time()
+        wst = time.perf_counter()
+        queryStart = vec_env.env_method("getQueryTime")
+        steps = 0
         for i in range(totalIter):
             sys.stdout.write("\r\t%d%%" % ((i/totalIter)*100))
             sys.stdout.flush()
@@ -168,14 +507,113 @@ class TestIt():
             episodeDone = False
             episodeReward = 0 
             while (not(episodeDone)):
-                action, _state = model.predict(obs, deterministic=True)
+                if (algo == "MaskablePPO"):
+                    action, _state = model.predict(obs, deterministic=True, 
+                                                   action_masks=np.array(vec_env.env_method("action_masks")))
+                else:
+                    action, _state = model.predict(obs, deterministic=True)
                 obs, reward, done, info = vec_env.step(action)
+                steps += 1
                 episodeReward = episodeReward + reward[0]
                 episodeDone = done[0]
             totalReward  = totalReward + episodeReward 
         print("")
         print("Learning simulations complete.")
         result = totalReward/totalIter
+        stats["testing"] = self.phaseStats(time.perf_counter() - wst, time.process_time() - st,
+                                           steps, totalIter, queryStart, vec_env.env_method("getQueryTime"))
         
         
-        return result, params
+        return result, params, stats
+
+    def evaluatePolicy(self, model, episodes, batch = 1, masked = False, seed = None):
+        """
+        The mean reward of a learned policy, acting deterministically, over a
+        number of episodes run on batch environments in this process: the
+        tester's own and batch - 1 more of the same domain. Every step predicts
+        the actions of all environments with an episode under way at once.
+        Episode i is reset with the i-th seed drawn from seed, whichever
+        environment runs it, so that the result does not depend on batch.
+        The throughput is left in self.evalStats (see phaseStats).
+
+        Parameters
+        ----------
+        model : stable-baselines3 model
+            The learned policy.
+        episodes : integer
+            The number of episodes.
+        batch : integer, optional
+            The number of environments. The default is 1.
+        masked : boolean, optional
+            Pass the action masks of the environments to predict (MaskablePPO). The default is False.
+        seed : integer, optional
+            The seed of the episode seeds. The default is None.
+
+        Returns
+        -------
+        float
+            The mean reward.
+        """
+        print("Starting batched testing..")
+        st = time.process_time()
+        wst = time.perf_counter()
+        self.env.setMasked(masked)
+        envs = self.evaluationEnvs(min(batch, episodes))
+        queryStart = [env.getQueryTime() for env in envs]
+        seeds = [int(x) for x in np.random.SeedSequence(seed).generate_state(episodes)]
+        rewards = np.zeros(episodes)
+        # The episode every environment runs, None once there are no more.
+        running = list(range(len(envs)))
+        obs = [env.reset(seed = seeds[i])[0] for i, env in zip(running, envs)]
+        nextEpisode = len(envs)
+        steps = 0
+        while any(i is not None for i in running):
+            active = [k for k, i in enumerate(running) if i is not None]
+            if masked:
+                actions, _ = model.predict(np.array([obs[k] for k in active]), deterministic = True,
+                                           action_masks = np.array([envs[k].action_masks() for k in active]))
+            else:
+                actions, _ = model.predict(np.array([obs[k] for k in active]), deterministic = True)
+            for k, action in zip(active, actions):
+                obs[k], reward, terminated, truncated, info = envs[k].step(int(action))
+                steps += 1
+                rewards[running[k]] += reward
+                if terminated or truncated:
+                    if (nextEpisode < episodes):
+                        running[k] = nextEpisode
+                        obs[k], _ = envs[k].reset(seed = seeds[nextEpisode])
+                        nextEpisode += 1
+                    else:
+                        running[k] = None
+            sys.stdout.write("\r\t%d%%" % ((min(nextEpisode, episodes) - len(active))/episodes*100))
+            sys.stdout.flush()
+        queryEnd = [env.getQueryTime() for env in envs]
+        for env in envs[1:]:
+            env.closeQE()
+        print("")
+        print("Learning simulations complete.")
+        self.evalStats = self.phaseStats(time.perf_counter() - wst, time.process_time() - st,
+                                         steps, episodes, queryStart, queryEnd)
+        return rewards.sum()/episodes
+
+    def evaluationEnvs(self, n):
+        # The tester's environment and n - 1 fresh ones of the same domain, 
+        # those of Prolog each with a query engine (engine module) of its own.
+        if (n > 1):
+            self.requireRebuildable("Testing in batches")
+        return [self.env] + [type(self.env)(self.env.file, **self.env.envArgs) for _ in range(n - 1)]
+
+    def phaseStats(self, wallTime, cpuTime, steps, episodes, queryStart, queryEnd):
+        # The throughput of a phase of test_learning: its wall-clock and CPU 
+        # time (of this process) in seconds, the environment steps and episodes
+        # it took and their rates, and the fraction of the wall-clock time the 
+        # environments spent in their query engines (averaged over the 
+        # environments, from their query times at the start and end of the phase).
+        queryTime = sum(e - s for e, s in zip(queryEnd, queryStart))/len(queryEnd)
+        return {"wallTime": wallTime,
+                "cpuTime": cpuTime,
+                "steps": steps,
+                "episodes": episodes,
+                "stepsPerSecond": steps/wallTime if wallTime else 0.0,
+                "episodesPerSecond": episodes/wallTime if wallTime else 0.0,
+                "queryFraction": queryTime/wallTime if wallTime else 0.0}
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized GMEnv: several environments stepped as a batch, for learning
+algorithms that collect rollouts from all of them at once.
+
+@author: Anonymous
+"""
+
+from functools import partial
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from stable_baselines3.common.env_util import make_vec_env, is_wrapped
+from stable_baselines3.common.monitor import Monitor
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecEnv
+from .GMEnv import GMEnv
+
+
+def makeVecGMEnv(file,numEnvs = 1,seed = None,subprocess = True,startMethod = "spawn",sharedMemory = False,envClass = GMEnv,**envArgs):
+    """
+    Builds numEnvs GMEnv instances of the same domain, each wrapped in a Monitor
+    reporting is_success, as one stable-baselines3 VecEnv.
+
+    With subprocess, every environment lives in a worker process of its own
+    (SubprocVecEnv) with its own Prolog engine and consulted domain, so that
+    the workers query Prolog in parallel. step() is synchronous; step_async()
+    and step_wait() let the caller work while the workers step. Otherwise all
+    environments share the calling process (DummyVecEnv) and step one after
+    the other.
+
+    Parameters
+    ----------
+    file : String
+        The path of the domain specification.
+    numEnvs : integer, optional
+        The number of environments. The default is 1.
+    seed : integer, optional
+        Worker i is seeded with seed + i on its first reset. The default is None (no seeding).
+    subprocess : boolean, optional
+        Run the environments in worker processes. The default is True.
+    sharedMemory : boolean, optional
+        Have the workers exchange observations, rewards, terminations and
+        action masks through shared memory (see SharedMemoryVecGMEnv). The
+        default is False.
+    startMethod : String, optional
+        How worker processes are started. The default is "spawn": each worker
+        starts a fresh interpreter rather than inherit the caller's Prolog state.
+    envClass : class, optional
+        The environment class, built as envClass(file, **envArgs). The default
+        is GMEnv; GMTableEnv takes its source (archive or arrays) as file.
+    **envArgs :
+        Keyword arguments of the environment constructor (progression, obsMode, ...).
+
+    Returns
+    -------
+    VecEnv
+        The vectorized environment.
+    """
+    if subprocess and sharedMemory:
+        return SharedMemoryVecGMEnv(file, numEnvs, seed, startMethod, envClass, **envArgs)
+    if subprocess:
+        vecEnvClass = SubprocVecEnv
+        vecEnvArgs = {"start_method": startMethod}
+    else:
+        vecEnvClass = DummyVecEnv
+        vecEnvArgs = None
+    return make_vec_env(partial(envClass, file), n_envs = numEnvs, seed = seed,
+                        env_kwargs = envArgs,
+                        vec_env_cls = vecEnvClass, vec_env_kwargs = vecEnvArgs,
+                        monitor_kwargs = {"info_keywords": ("is_success",)})
+
+
+def sharedArrays(spec,names = None):
+    """
+    Creates (or, given their names, attaches to) shared memory blocks and
+    returns them along with NumPy arrays over them.
+
+    Parameters
+    ----------
+    spec : dict
+        The shape and dtype of every array, by key.
+    names : dict, optional
+        The names of existing blocks, by key. The default is None (create them).
+    """
+    blocks, arrays = {}, {}
+    for key, (shape, dtype) in spec.items():
+        dtype = np.dtype(dtype)
+        if (names is None):
+            size = max(int(np.prod(shape))*dtype.itemsize, 1)
+            blocks[key] = SharedMemory(create = True, size = size)
+        else:
+            blocks[key] = SharedMemory(name = names[key])
+        arrays[key] = np.ndarray(shape, dtype = dtype, buffer = blocks[key].buf)
+    return blocks, arrays
+
+
+def serveSharedMemoryEnv(conn,index,envClass,file,envArgs):
+    """
+    The loop of a SharedMemoryVecGMEnv worker: steps its environment on the
+    action found in shared memory and writes back the outcome. Only control
+    messages and, when due, info dicts travel through the pipe.
+    """
+    env = Monitor(envClass(file, **envArgs), info_keywords = ("is_success",))
+    conn.send((env.observation_space, env.action_space))
+    spec, names = conn.recv()
+    blocks, arrays = sharedArrays(spec, names)
+    sendInfos = False
+
+    def write(obs):
+        arrays["obs"][index] = obs
+        # Only masked learners need the mask of every step, and it takes a
+        # query of its own (see GMEnv.situationInfo).
+        if getattr(env.unwrapped, "masked", False):
+            arrays["masks"][index] = env.unwrapped.action_masks()
+
+    while True:
+        try:
+            cmd, data = conn.recv()
+        except EOFError:
+            break
+        if (cmd == "step"):
+            obs, reward, terminated, truncated, info = env.step(int(arrays["actions"][index]))
+            done = terminated or truncated
+            if done:
+                info["terminal_observation"] = obs
+                info["TimeLimit.truncated"] = truncated and not terminated
+                obs, _ = env.reset()
+            write(obs)
+            arrays["rewards"][index] = reward
+            arrays["dones"][index] = done
+            conn.send(info if (done or sendInfos) else None)
+        elif (cmd == "reset"):
+            seed, options = data
+            obs, info = env.reset(seed = seed, options = options)
+            write(obs)
+            conn.send(info)
+        elif (cmd == "infos"):
+            sendInfos = data
+            conn.send(None)
+        elif (cmd == "getattr"):
+            conn.send(env.get_wrapper_attr(data))
+        elif (cmd == "setattr"):
+            setattr(env.unwrapped, data[0], data[1])
+            conn.send(None)
+        elif (cmd == "method"):
+            name, args, kwargs = data
+            conn.send(env.get_wrapper_attr(name)(*args, **kwargs))
+        elif (cmd == "is_wrapped"):
+            conn.send(is_wrapped(env, data))
+        elif (cmd == "close"):
+            env.unwrapped.closeQE()
+            conn.send(None)
+            break
+    for block in blocks.values():
+        block.close()
+    conn.close()
+
+
+class SharedMemoryVecGMEnv(VecEnv):
+    """
+    A VecEnv of GMEnv workers, each in a process of its own like SubprocVecEnv,
+    that share their observations, rewards, terminations and (if masked) action
+    masks with the caller through preallocated shared memory arrays. Actions are written to
+    shared memory too, so that a step only sends a short control message to
+    every worker and receives an acknowledgment. The info dict of a worker is
+    only sent back when its episode ends (with the terminal observation and the
+    Monitor's episode statistics) or after requestInfos(True).
+    """
+
+    def __init__(self,file,numEnvs,seed = None,startMethod = "spawn",envClass = GMEnv,**envArgs):
+        """
+        Parameters
+        ----------
+        file : String
+            The path of the domain specification.
+        numEnvs : integer
+            The number of workers.
+        seed : integer, optional
+            Worker i is seeded with seed + i on its first reset. The default is None.
+        startMethod : String, optional
+            How worker processes are started. The default is "spawn".
+        envClass : class, optional
+            The environment class (see makeVecGMEnv). The default is GMEnv.
+        **envArgs :
+            Keyword arguments of the environment constructor.
+        """
+        ctx = mp.get_context(startMethod)
+        self.conns = []
+        self.processes = []
+        for i in range(numEnvs):
+            conn, child = ctx.Pipe()
+            process = ctx.Process(target = serveSharedMemoryEnv, args = (child, i, envClass, file, envArgs), daemon = True)
+            process.start()
+            child.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+        observation_space, action_space = [conn.recv() for conn in self.conns][0]
+
+        spec = {"obs": ((numEnvs,) + observation_space.shape, observation_space.dtype.str),
+                "actions": ((numEnvs,), np.int64),
+                "rewards": ((numEnvs,), np.float64),
+                "dones": ((numEnvs,), np.bool_),
+                "masks": ((numEnvs, action_space.n), np.bool_)}
+        self.blocks, self.buffers = sharedArrays(spec)
+        names = {key: block.name for key, block in self.blocks.items()}
+        for conn in self.conns:
+            conn.send((spec, names))
+        super().__init__(numEnvs, observation_space, action_space)
+        self.closed = False
+        # Whether the workers keep their action masks in shared memory.
+        self.masked = envArgs.get("masked", False)
+        if (seed is not None):
+            self.seed(seed)
+
+    def call(self,cmd,data,indices = None):
+        targets = [self.conns[i] for i in self._get_indices(indices)]
+        for conn in targets:
+            conn.send((cmd, data))
+        return [conn.recv() for conn in targets]
+
+    def requestInfos(self,enabled = True):
+        """
+        Have the workers send their info dict after every step, not only at the
+        end of episodes.
+        """
+        self.call("infos", enabled)
+
+    def reset(self):
+        for i, conn in enumerate(self.conns):
+            conn.send(("reset", (self._seeds[i], self._options[i])))
+        self.reset_infos = [conn.recv() for conn in self.conns]
+        self._reset_seeds()
+        self._reset_options()
+        return self.buffers["obs"].copy()
+
+    def step_async(self,actions):
+        self.buffers["actions"][:] = actions
+        for conn in self.conns:
+            conn.send(("step", None))
+
+    def step_wait(self):
+        infos = [conn.recv() or {} for conn in self.conns]
+        return (self.buffers["obs"].copy(), self.buffers["rewards"].copy(),
+                self.buffers["dones"].copy(), infos)
+
+    def action_masks(self):
+        return np.array(self.env_method("action_masks"))
+
+    def get_attr(self,attr_name,indices = None):
+        return self.call("getattr", attr_name, indices)
+
+    def set_attr(self,attr_name,value,indices = None):
+        self.call("setattr", (attr_name, value), indices)
+
+    def env_method(self,method_name,*method_args,indices = None,**method_kwargs):
+        if (method_name == "action_masks") and self.masked and not (method_args or method_kwargs):
+            # Already in shared memory.
+            return [self.buffers["masks"][i].copy() for i in self._get_indices(indices)]
+        return self.call("method", (method_name, method_args, method_kwargs), indices)
+
+    def env_is_wrapped(self,wrapper_class,indices = None):
+        return self.call("is_wrapped", wrapper_class, indices)
+
+    def close(self):
+        if self.closed:
+            return
+        self.call("close", None)
+        for process in self.processes:
+            process.join()
+        for conn in self.conns:
+            conn.close()
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.closed = True
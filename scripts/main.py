@@ -10,6 +10,10 @@ sys.path.append(parent_dir)
 
 from scripts import GMEnv
 from scripts import Tester
+from scripts import MDPExport
+from scripts import GMTableEnv
+from scripts import Solver
+import time
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Run RL trials with configurable paths')
@@ -18,8 +22,10 @@ def parse_args():
                       help='Path to the config file')
     parser.add_argument('--sim-params', type=str, default='[1]',
                       help='Simulation parameters for semi-random simulation (default: [1])')
-    parser.add_argument('--mode', type=str, choices=['simulate', 'train'], required=True,
-                      help='Mode to run: simulate (run simulations only) or train (run training only)')
+    parser.add_argument('--mode', type=str, choices=['simulate', 'train', 'export', 'solve'], required=True,
+                      help='Mode to run: simulate (run simulations only), train (run training only), export (write the reachable MDP as arrays) or solve (compute the optimal expected reward)')
+    parser.add_argument('--output', type=str, default=None,
+                      help='Path of the .npz file written in export mode (default: next to the Prolog file)')
     return parser.parse_args()
 
 def load_config(config_path):
@@ -29,66 +35,173 @@ def load_config(config_path):
     with open(config_path, 'r') as f:
         return json.load(f)
 
+def make_env(pl_file, config):
+    """Construct the environment with the query engine options of the configuration."""
+    if config.get('backend', 'prolog') == 'table':
+        env = GMTableEnv.GMTableEnv(pl_file, obsMode=config.get('obsMode', 'discrete'),
+                                    infoLevel=config.get('infoLevel', 'debug'))
+        print('Environment compile time: {:.3f} seconds'.format(env.compileTime))
+        return env
+    env = GMEnv.GMEnv(pl_file, qlfCache=config.get('qlfCache', False),
+                      progression=config.get('progression', False),
+                      obsMode=config.get('obsMode', 'discrete'),
+                      infoLevel=config.get('infoLevel', 'debug'))
+    print('Environment startup time: {:.3f} seconds'.format(env.qmi.getLoadTime()))
+    return env
+
 def run_simulation(pl_file, config, sim_params):
     """Run simulation mode with the given configuration."""
-    env = GMEnv.GMEnv(pl_file)
+    if config.get('simInProlog', False) and config.get('backend', 'prolog') == 'table':
+        print("Error: simInProlog needs the prolog backend")
+        sys.exit(1)
+    if config.get('simInProlog', False) and config.get('simTargetHalfWidth') is not None:
+        print("Error: simInProlog runs a fixed number of episodes; it cannot be combined with simTargetHalfWidth")
+        sys.exit(1)
+    if config.get('simInProlog', False) and config.get('simWorkers'):
+        print("Error: simInProlog runs all episodes in one query; it cannot be combined with simWorkers")
+        sys.exit(1)
+    env = make_env(pl_file, config)
     env.setDebug(config['debug'])
     env.setSeed(config['seed'])
     tester = Tester.TestIt(env)
     tester.debug = config['debug']
     
     results = {}
+    # With simWorkers, episodes are spread over that many processes and 
+    # seeded from the configured seed, so results do not depend on their number.
+    # Simulations within Prolog are seeded from it too.
+    workers = config.get('simWorkers')
+    simSeed = config['seed'] if (workers or config.get('simInProlog', False)) else None
+    # With simTargetHalfWidth, each simulation stops as soon as the confidence 
+    # interval of its mean is that narrow, the iterations being the maximum.
+    targetHalfWidth = config.get('simTargetHalfWidth')
+    intervals = {}
+    # With simRecordDir, the per-episode records of each simulation are kept 
+    # there as <name>.npy.
+    recordDir = config.get('simRecordDir')
+    summaries = {}
+
+    def simulate(name, iterations, policy=[], forgivePenalty=True, masked=False):
+        if targetHalfWidth is None:
+            result = tester.simulate(iterations, policy, forgivePenalty=forgivePenalty, masked=masked,
+                                     inProlog=config.get('simInProlog', False),
+                                     workers=workers, seed=simSeed,
+                                     recordPath=os.path.join(recordDir, name + '.npy') if recordDir else None)
+            summaries[name] = tester.simSummary
+            return result
+        mean, interval, used = tester.simulateAdaptive(targetHalfWidth, 
+                                                       minEpisodes=min(config.get('simMinIter', 100), iterations),
+                                                       maxEpisodes=iterations, policy=policy,
+                                                       forgivePenalty=forgivePenalty, masked=masked,
+                                                       confidence=config.get('simConfidence', 0.95),
+                                                       workers=workers, seed=config['seed'],
+                                                       recordPath=os.path.join(recordDir, name + '.npy') if recordDir else None)
+        intervals[name] = (interval, used)
+        summaries[name] = tester.simSummary
+        return mean
     
     # Run optimal simulation first (matching 3SBuild_Trials.py order)
     if config.get('simOptimalIter', 0) > 0:
         print("\nRunning optimal simulation...")
-        results['optimal'] = tester.simulate(config['simOptimalIter'], config['optimalSimParams'])
+        results['optimal'] = simulate('optimal', config['simOptimalIter'], config['optimalSimParams'])
+        if env.qmi is not None:
+            results['optimal_exact'] = tester.evaluate_exact(config['optimalSimParams'])
     
     # Run random simulation with penalty forgiveness
     if config.get('simRandomIter', 0) > 0:
         print("\nRunning random simulation with penalty forgiveness...")
-        results['random_forgive'] = tester.simulate(config['simRandomIter'])
+        results['random_forgive'] = simulate('random_forgive', config['simRandomIter'], 
+                                             masked=config.get('simMasked', False))
     
     # Run random simulation without penalty forgiveness
     if config.get('simRandomIter', 0) > 0:
         print("\nRunning random simulation without penalty forgiveness...")
-        results['random'] = tester.simulate(config['simRandomIter'], forgivePenalty=False)
+        results['random'] = simulate('random', config['simRandomIter'], forgivePenalty=False, 
+                                     masked=config.get('simMasked', False))
     
     # Print results in the same format as 3SBuild_Trials.py
     print("\nSimulation Results:")
     if 'optimal' in results:
         print('DT-Golog - simulated policy reward.: {}'.format(results['optimal']))
+    if 'optimal_exact' in results:
+        print('DT-Golog - exact policy reward.....: {}'.format(results['optimal_exact']))
     if 'random_forgive' in results:
         print('Random simulated policy reward (fg): {}'.format(results['random_forgive']))
     if 'random' in results:
         print('Random simulated policy reward.....: {}'.format(results['random']))
+    for name, ((low, high), used) in intervals.items():
+        print('Confidence interval ({}): [{}, {}] after {} episodes'.format(name, low, high, used))
+    for name, summary in summaries.items():
+        print('Reward distribution ({}): std {:.4f}, min {}, median {}, max {}, 5%-95% [{}, {}]'.format(
+            name, summary['std'], summary['min'], summary['percentiles'][50], summary['max'],
+            summary['percentiles'][5], summary['percentiles'][95]))
     
     env.closeQE()
     return results
 
 def run_training(pl_file, config):
     """Run training mode with the given configuration."""
-    env = GMEnv.GMEnv(pl_file)
+    env = make_env(pl_file, config)
     env.setDebug(config['debug'])
     env.setSeed(config['seed'])
     tester = Tester.TestIt(env)
     tester.debug = config['debug']
     
     print("\nStarting training...")
-    result, params = tester.test_learning(
+    result, params, stats = tester.test_learning(
         config['trainingIter'],
         config['testingIter'],
         logging=config['learningLoggingInterval'],
-        algo=config['learningAlgorithm']
+        algo=config['learningAlgorithm'],
+        numEnvs=config.get('learningNumEnvs', 1),
+        sharedMemory=config.get('learningSharedMemory', False),
+        seed=config['seed'],
+        testBatch=config.get('testingBatch')
     )
     
     # Print results in the same format as 3SBuild_Trials.py
     print("\nTraining Results:")
     print('Learned policy reward..............: {}'.format(result))
     print('--> Learning Parameters: \n {}'.format(params))
+    for phase, phaseStats in stats.items():
+        print('--> {} throughput: {:.3f} s wall ({:.3f} s CPU), {} steps ({:.1f}/s), {} episodes ({:.1f}/s), {:.1%} of the time in queries'.format(
+            phase.capitalize(), phaseStats['wallTime'], phaseStats['cpuTime'], phaseStats['steps'], phaseStats['stepsPerSecond'],
+            phaseStats['episodes'], phaseStats['episodesPerSecond'], phaseStats['queryFraction']))
     
     env.closeQE()
-    return result, params
+    return result, params, stats
+
+def run_export(pl_file, output=None):
+    """Write the reachable state space of the domain as an MDP in an .npz file."""
+    if output is None:
+        output = os.path.splitext(pl_file)[0] + '.npz'
+    exporter = MDPExport.MDPExporter(pl_file)
+    mdp = exporter.export(output)
+    exporter.close()
+    print('Exported {} states and {} transitions to {}'.format(
+        len(mdp['done']), len(mdp['P_s']), output))
+    return mdp
+
+def run_solve(pl_file, config):
+    """Compute the optimal expected reward and policy by value iteration."""
+    start = time.perf_counter()
+    if pl_file.endswith('.npz'):
+        mdp = MDPExport.loadMDP(pl_file)
+    else:
+        exporter = MDPExport.MDPExporter(pl_file)
+        mdp = exporter.explore()
+        exporter.close()
+    exported = time.perf_counter()
+    solution = Solver.valueIteration(mdp)
+    solved = time.perf_counter()
+
+    print("\nSolver Results:")
+    print('States / transitions...............: {} / {}'.format(len(mdp['done']), len(mdp['P_s'])))
+    print('Optimal expected reward............: {}'.format(solution['value']))
+    print('Optimal first action...............: {}'.format(solution['policy'][0]))
+    print('Exploration time...................: {:.3f} seconds'.format(exported - start))
+    print('Value iteration time...............: {:.3f} seconds ({} sweeps)'.format(solved - exported, solution['iterations']))
+    return solution
 
 def main():
     args = parse_args()
@@ -111,5 +224,11 @@ def main():
     elif args.mode == 'train':
         run_training(args.pl_file, config)
 
+    elif args.mode == 'export':
+        run_export(args.pl_file, args.output)
+
+    elif args.mode == 'solve':
+        run_solve(args.pl_file, config)
+
 if __name__ == '__main__':
     main()
\ No newline at end of file